@@ -1 +1,16 @@
-from .weather_server import WeatherServer
\ No newline at end of file
+# 服务端实现依赖 mcp、Starlette 与 httpx，首次访问时才导入（PEP 562）
+import importlib
+
+__all__ = ["WeatherServer"]
+
+
+def __getattr__(name):
+    if name in __all__:
+        value = getattr(importlib.import_module(".weather_server", __name__), name)
+        globals()[name] = value
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
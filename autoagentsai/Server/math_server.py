@@ -1,89 +1,739 @@
 # math_server.py
+import argparse
+import ast
+import asyncio
+import functools
 import json
+import math
+import operator
+import struct
 import sys
+import time
 import traceback
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 
-def main():
-    # 定义数学工具描述（固定格式，与客户端匹配）
-    tools = [
-        {
-            "name": "calculate",
-            "description": "执行数学计算，支持加减乘除、括号优先级",
-            "parameters": {
-                "expression": {
-                    "type": "string",
-                    "description": "数学表达式，例如 '2 + 2 / 7 - 9' 或 '(5 + 3) * 2'"
-                }
+try:
+    import numpy
+except ImportError:  # 未安装 numpy 时批量请求逐条求值
+    numpy = None
+
+try:
+    import orjson
+except ImportError:  # 未安装 orjson 时使用标准库 json
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # 未安装 msgpack 时只支持 JSON 行格式
+    msgpack = None
+
+# 服务版本号，随 LIST 响应返回，客户端据此判断缓存的工具列表是否过期
+SERVER_VERSION = "1.1.0"
+
+# 并发模式下单条请求的默认超时（秒）
+DEFAULT_TIMEOUT = 10.0
+# 并发模式下单行命令的长度上限
+_STREAM_LIMIT = 16 * 1024 * 1024
+
+# 表达式求值限制：防止 9**9**9 之类的输入耗尽 CPU 和内存
+MAX_EXPRESSION_LENGTH = 10000
+MAX_EXPONENT = 1000
+MAX_INT_BITS = 4096
+# 嵌套深度不超过该值的表达式编译成嵌套闭包（求值最快），更深的按后缀指令循环求值，避免递归过深
+CLOSURE_MAX_DEPTH = 100
+# 已编译表达式的 LRU 缓存容量
+EXPRESSION_CACHE_SIZE = 4096
+# 同结构表达式达到该数量时才用 numpy 向量化求值
+VECTORIZE_MIN_BATCH = 8
+# 并发模式下批量请求拆分给各工作进程的块大小
+BATCH_CHUNK_SIZE = 256
+
+# 线路格式：默认一行一条 JSON；客户端在 LIST 载荷的 formats 中按优先级声明支持的格式，
+# 服务端在 LIST 响应的 format 字段中选定一种，写出该响应后双向都改用选定的格式
+WIRE_FORMATS = ("msgpack", "json") if msgpack is not None else ("json",)
+# MessagePack 帧头：4 字节大端无符号整数，表示帧体长度
+_FRAME_HEADER = struct.Struct(">I")
+
+# 定义数学工具描述（固定格式，与客户端匹配）
+TOOLS = [
+    {
+        "name": "calculate",
+        "description": "执行数学计算，支持加减乘除、整除、乘方和括号优先级",
+        "parameters": {
+            "expression": {
+                "type": "string",
+                "description": "数学表达式，例如 '2 + 2 / 7 - 9' 或 '(5 + 3) * 2'"
             }
         }
-    ]
-    
+    }
+]
+
+
+_ALLOWED_CHARS = frozenset("0123456789+-*/(). ")
+
+
+def _check_int(value):
+    if isinstance(value, int) and value.bit_length() > MAX_INT_BITS:
+        raise ValueError("数值过大")
+    return value
+
+
+def _safe_mul(a, b):
+    if isinstance(a, int) and isinstance(b, int) and a.bit_length() + b.bit_length() > MAX_INT_BITS:
+        raise ValueError("数值过大")
+    return a * b
+
+
+def _safe_pow(a, b):
+    if abs(b) > MAX_EXPONENT:
+        raise ValueError("指数过大")
+    # 先估算整数幂的位数，超限时不做计算
+    if isinstance(a, int) and isinstance(b, int) and b > 0 and a.bit_length() * b > MAX_INT_BITS:
+        raise ValueError("数值过大")
+    return a ** b
+
+
+_BIN_OPS = {
+    ast.Add: operator.add,
+    ast.Sub: operator.sub,
+    ast.Mult: _safe_mul,
+    ast.Div: operator.truediv,
+    ast.FloorDiv: operator.floordiv,
+    ast.Pow: _safe_pow,
+}
+
+_UNARY_OPS = {
+    ast.UAdd: operator.pos,
+    ast.USub: operator.neg,
+}
+
+
+def _compile_node(node):
+    """
+    把 AST 节点编译成后缀指令序列，只接受算术节点，返回 (指令序列, 嵌套深度)。
+
+    迭代地做后序遍历，长度上限内的 "1 + 1 + ..." 长链也不会触发 RecursionError。
+    每条指令为 (操作数个数, 值或运算)，操作数个数为 0 表示常量。
+    """
+    program = []
+    max_depth = 0
+    stack = [(node, False, 1)]
+    while stack:
+        node, ready, depth = stack.pop()
+        max_depth = max(max_depth, depth)
+        if isinstance(node, ast.Constant) and type(node.value) in (int, float):
+            program.append((0, _check_int(node.value)))
+        elif isinstance(node, ast.BinOp) and type(node.op) in _BIN_OPS:
+            if ready:
+                program.append((2, _BIN_OPS[type(node.op)]))
+            else:
+                stack += [(node, True, depth), (node.right, False, depth + 1), (node.left, False, depth + 1)]
+        elif isinstance(node, ast.UnaryOp) and type(node.op) in _UNARY_OPS:
+            if ready:
+                program.append((1, _UNARY_OPS[type(node.op)]))
+            else:
+                stack += [(node, True, depth), (node.operand, False, depth + 1)]
+        else:
+            raise ValueError(f"不支持的语法: {type(node).__name__}")
+    return tuple(program), max_depth
+
+
+def _closure(program):
+    """把后缀指令序列组装成嵌套的无参闭包，求值时递归深度等于表达式的嵌套深度"""
+    stack = []
+    for arity, item in program:
+        if arity == 2:
+            right, left = stack.pop(), stack.pop()
+            stack.append(lambda op=item, left=left, right=right: _check_int(op(left(), right())))
+        elif arity:
+            operand = stack.pop()
+            stack.append(lambda op=item, operand=operand: op(operand()))
+        else:
+            stack.append(lambda value=item: value)
+    return stack[0]
+
+
+def _run_program(program):
+    """按后缀指令序列循环求值，不受嵌套深度限制，求值顺序和限制检查与闭包一致"""
+    stack = []
+    push, pop = stack.append, stack.pop
+    for arity, item in program:
+        if arity == 2:
+            right = pop()
+            push(_check_int(item(pop(), right)))
+        elif arity:
+            push(item(pop()))
+        else:
+            push(item)
+    return stack[0]
+
+
+def normalize_expression(expression):
+    """规范化表达式作为缓存键：去掉首尾空白，连续空白折叠为一个空格"""
+    return " ".join(expression.split())
+
+
+@functools.lru_cache(maxsize=EXPRESSION_CACHE_SIZE)
+def parse_expression(normalized):
+    """解析规范化后的表达式，返回 AST 表达式节点（结果按 LRU 缓存）"""
+    if len(normalized) > MAX_EXPRESSION_LENGTH:
+        raise ValueError("表达式过长")
+    # 仅允许数字和运算符，禁止函数调用
+    if not _ALLOWED_CHARS.issuperset(normalized):
+        raise ValueError("表达式包含不允许的字符")
+    try:
+        return ast.parse(normalized, mode="eval").body
+    except (RecursionError, MemoryError):
+        # 解析器自身对嵌套深度有限制（如数千层的一元负号或乘方）
+        raise ValueError("表达式嵌套过深") from None
+
+
+@functools.lru_cache(maxsize=EXPRESSION_CACHE_SIZE)
+def compile_expression(normalized):
+    """校验并编译规范化后的表达式，返回可重复求值的闭包（结果按 LRU 缓存）"""
+    program, depth = _compile_node(parse_expression(normalized))
+    if depth <= CLOSURE_MAX_DEPTH:
+        return _closure(program)
+    return functools.partial(_run_program, program)
+
+
+def calculate(expression):
+    """计算表达式，返回响应字典（result 或 error）"""
+    # 基于 AST 白名单求值，不使用 eval
+    try:
+        if not isinstance(expression, str):
+            raise ValueError("表达式必须是字符串")
+        result = float(compile_expression(normalize_expression(expression))())
+        if not math.isfinite(result):
+            raise ValueError("结果溢出")
+        return {"result": result}  # 统一返回浮点数
+    except Exception as e:
+        return {"error": f"计算错误: {str(e)}"}
+
+
+# 可向量化的运算：不含乘方与整除，float64 下不会出现整数爆炸
+_VECTOR_BIN_OPS = {
+    ast.Add: operator.add,
+    ast.Sub: operator.sub,
+    ast.Mult: operator.mul,
+    ast.Div: operator.truediv,
+}
+
+# 纯整数子表达式的值（包括中间结果）上限：逐条求值时整数运算是精确的，
+# 只有全部不超过 2**53 时 float64 逐元素求值才能得到完全相同的结果
+_VECTOR_MAX_INT = 2 ** 53
+
+
+def _template(node, constants):
+    """
+    提取表达式结构：常量替换为占位符并按求值顺序收集到 constants，
+    返回可哈希的结构键；含不可向量化的节点、或纯整数部分超出 float64 精确范围时返回 None。
+    """
+    key, _ = _template_node(node, constants)
+    return key
+
+
+def _template_node(node, constants):
+    """返回 (结构键, 纯整数子表达式的精确值)；子表达式涉及浮点数时精确值为 None"""
+    if isinstance(node, ast.Constant):
+        exact = node.value if isinstance(node.value, int) else None
+        if exact is not None and abs(exact) >= _VECTOR_MAX_INT:
+            return None, None
+        constants.append(node.value)
+        return "c", exact
+    if isinstance(node, ast.BinOp) and type(node.op) in _VECTOR_BIN_OPS:
+        left, left_exact = _template_node(node.left, constants)
+        if left is None:
+            return None, None
+        right, right_exact = _template_node(node.right, constants)
+        if right is None:
+            return None, None
+        exact = None
+        if left_exact is not None and right_exact is not None and not isinstance(node.op, ast.Div):
+            exact = _VECTOR_BIN_OPS[type(node.op)](left_exact, right_exact)
+            if abs(exact) >= _VECTOR_MAX_INT:
+                return None, None
+        return (type(node.op), left, right, _unsigned_zero(node.op, exact)), exact
+    if isinstance(node, ast.UnaryOp) and type(node.op) in _UNARY_OPS:
+        operand, exact = _template_node(node.operand, constants)
+        if operand is None:
+            return None, None
+        exact = None if exact is None else _UNARY_OPS[type(node.op)](exact)
+        return (type(node.op), operand, _unsigned_zero(node.op, exact)), exact
+    return None, None
+
+
+def _unsigned_zero(op, exact):
+    """
+    纯整数子表达式逐条求值时是 int，没有 -0；float64 中乘法和取负却可能得到 -0.0（如 0 * -5、-0），
+    这两种运算的结果需要归一化为 +0.0。涉及浮点数的子表达式保留 IEEE 符号，与逐条求值一致（如 -(0 * 1.0)）。
+    """
+    return exact is not None and isinstance(op, (ast.Mult, ast.USub))
+
+
+def _eval_template(key, columns):
+    """按结构键对常量列（numpy 数组）逐元素求值"""
+    if key == "c":
+        return next(columns)
+    if len(key) == 4:
+        left = _eval_template(key[1], columns)
+        values = _VECTOR_BIN_OPS[key[0]](left, _eval_template(key[2], columns))
+    else:
+        values = _UNARY_OPS[key[0]](_eval_template(key[1], columns))
+    # -0.0 + 0.0 == +0.0，其余值不变
+    return values + 0.0 if key[-1] else values
+
+
+def calculate_batch(expressions):
+    """
+    批量计算表达式，按输入顺序返回响应字典列表。
+
+    安装了 numpy 时，结构相同的表达式（如 "a * b + c"）合并为一组，
+    把常量排成矩阵后对整组一次性向量化求值，结果与逐条求值完全一致。
+    纯整数部分可能超过 2**53 的表达式、非有限值（除零、溢出）以及无法向量化的表达式
+    回退到逐条求值，以得到精确的结果与准确的错误信息。
+    """
+    results = [None] * len(expressions)
+    groups = {}
+    if numpy is not None and len(expressions) >= VECTORIZE_MIN_BATCH:
+        for index, expression in enumerate(expressions):
+            try:
+                normalized = normalize_expression(expression)
+                compile_expression(normalized)  # 校验语法与限制
+                constants = []
+                key = _template(parse_expression(normalized), constants)
+            except Exception:
+                continue
+            if key is not None:
+                groups.setdefault(key, ([], []))
+                groups[key][0].append(index)
+                groups[key][1].append(constants)
+
+    for key, (indices, rows) in groups.items():
+        if len(indices) < VECTORIZE_MIN_BATCH:
+            continue
+        matrix = numpy.array(rows, dtype=numpy.float64).reshape(len(rows), -1)
+        with numpy.errstate(all="ignore"):
+            values = _eval_template(key, iter(matrix.T)) if matrix.shape[1] else matrix[:, 0]
+            values = numpy.broadcast_to(values, (len(indices),))
+        for index, value in zip(indices, values.tolist()):
+            if math.isfinite(value):
+                results[index] = {"result": value}
+
+    for index, expression in enumerate(expressions):
+        if results[index] is None:
+            results[index] = calculate(expression)
+    return results
+
+
+def dumps(obj):
+    """序列化为 JSON 字节串，orjson 可用时优先使用"""
+    if orjson is not None:
+        try:
+            return orjson.dumps(obj)
+        except TypeError:
+            pass
+    return json.dumps(obj).encode()
+
+
+def loads(data):
+    return orjson.loads(data) if orjson is not None else json.loads(data)
+
+
+def encode_response(response, wire_format):
+    """按线路格式编码一条响应：JSON 行或长度前缀的 MessagePack 帧"""
+    if wire_format == "msgpack":
+        body = msgpack.packb(response)
+        return _FRAME_HEADER.pack(len(body)) + body
+    return dumps(response) + b"\n"
+
+
+def decode_frame(body):
+    """解析一个 MessagePack 请求帧 [action, payload]，返回 (动作, 载荷)"""
+    action, payload = msgpack.unpackb(body)
+    if not isinstance(payload, dict):
+        raise ValueError("载荷必须是对象")
+    return action, payload
+
+
+def read_frame(stream):
+    """从阻塞的二进制流读取一个帧体，流结束时返回 None"""
+    header = stream.read(_FRAME_HEADER.size)
+    if len(header) < _FRAME_HEADER.size:
+        return None
+    size = _FRAME_HEADER.unpack(header)[0]
+    body = stream.read(size)
+    return body if len(body) == size else None
+
+
+def negotiate_format(payload):
+    """从客户端声明的 formats 中选出第一个支持的格式；未声明（旧版客户端）时返回 None"""
+    formats = payload.get("formats")
+    if not isinstance(formats, list):
+        return None
+    return next((name for name in formats if name in WIRE_FORMATS), "json")
+
+
+def parse_command(command):
+    """
+    解析一行命令，返回 (动作, 载荷)。
+
+    支持 "LIST"、"LIST <json>"、"INVOKE <json>" 与 "CANCEL <json>"，载荷中可带
+    可选的 id 字段，服务端会在响应中原样回传，客户端据此在同一管道上流水线发送多个请求。
+    """
+    if command == "LIST":
+        return "LIST", {}
+    for action in ("LIST", "INVOKE", "BATCH_INVOKE", "CANCEL"):
+        prefix = action + " "
+        if command.startswith(prefix):
+            payload = loads(command[len(prefix):])
+            if not isinstance(payload, dict):
+                raise ValueError("载荷必须是 JSON 对象")
+            return action, payload
+    return None, {}
+
+
+def with_id(response, payload):
+    """若请求带有 id，则在响应中回传"""
+    if "id" in payload:
+        response["id"] = payload["id"]
+    return response
+
+
+def with_timing(response, payload, started):
+    """
+    请求携带 _meta.traceparent（客户端开启了追踪）时，在响应的 _meta.timing 中
+    回传服务端处理耗时（毫秒），未追踪的请求响应保持不变
+    """
+    meta = payload.get("_meta")
+    if isinstance(meta, dict) and "traceparent" in meta:
+        response["_meta"] = {"timing": {"eval_ms": round((time.perf_counter() - started) * 1000, 3)}}
+    return response
+
+
+def invoke_params(payload):
+    """取出 INVOKE 载荷中的工具名与参数，格式不合法时抛出异常"""
+    tool_name = payload["name"]
+    params = payload["parameters"]
+    if not isinstance(params, dict):
+        raise ValueError("parameters 必须是 JSON 对象")
+    return tool_name, params
+
+
+def batch_params(payload):
+    """取出 BATCH_INVOKE 载荷中的工具名与参数列表，格式不合法时抛出异常"""
+    tool_name = payload["name"]
+    params_list = payload["parameters"]
+    if not isinstance(params_list, list) or not all(isinstance(p, dict) for p in params_list):
+        raise ValueError("parameters 必须是 JSON 对象数组")
+    return tool_name, params_list
+
+
+def handle_command(command):
+    """处理一条命令并返回响应字典（CANCEL 不产生响应，返回 None）"""
+    try:
+        action, payload = parse_command(command)
+    except Exception as e:
+        return {"error": f"解析错误: {str(e)}"}
+    return handle_request(action, payload, command)
+
+
+def handle_request(action, payload, command):
+    """处理已解析的命令"""
+    # 处理 LIST 命令（返回工具列表）
+    if action == "LIST":
+        response = {"tools": TOOLS, "version": SERVER_VERSION}
+        wire_format = negotiate_format(payload)
+        if wire_format is not None:
+            # 调用方在写出该响应后切换线路格式
+            response["format"] = wire_format
+        return with_id(response, payload)
+
+    # 处理 INVOKE 命令（执行计算）
+    if action == "INVOKE":
+        try:
+            tool_name, params = invoke_params(payload)
+        except Exception as e:
+            return with_id({"error": f"解析错误: {str(e)}"}, payload)
+        if tool_name == "calculate":
+            started = time.perf_counter()
+            return with_id(with_timing(calculate(params.get("expression", "")), payload, started), payload)
+        return with_id({"error": f"未知工具: {tool_name}"}, payload)
+
+    # 处理 BATCH_INVOKE 命令（批量计算，结果按输入顺序返回）
+    if action == "BATCH_INVOKE":
+        try:
+            tool_name, params_list = batch_params(payload)
+        except Exception as e:
+            return with_id({"error": f"解析错误: {str(e)}"}, payload)
+        if tool_name == "calculate":
+            expressions = [params.get("expression", "") for params in params_list]
+            started = time.perf_counter()
+            return with_id(with_timing({"results": calculate_batch(expressions)}, payload, started), payload)
+        return with_id({"error": f"未知工具: {tool_name}"}, payload)
+
+    # 顺序模式下请求总是已完成，CANCEL 无需处理
+    if action == "CANCEL":
+        return None
+
+    # 处理未知命令
+    return {"error": f"未知命令: {command}，支持 LIST、INVOKE 或 BATCH_INVOKE"}
+
+
+def main():
     print("数学服务启动成功，等待命令...", file=sys.stderr)  # 仅用于调试，不影响客户端通信
-    
+    # 直接读写二进制流：协商为 MessagePack 后需要按帧读取，文本层的预读缓冲会吞掉帧数据
+    stdin, stdout = sys.stdin.buffer, sys.stdout.buffer
+    wire_format = "json"
+
     while True:
         try:
-            # 读取客户端命令（同步读取，更稳定）
-            line = sys.stdin.readline()
-            if not line:  # 客户端关闭连接
-                print("客户端断开连接", file=sys.stderr)
-                break
-            
-            command = line.strip()
-            print(f"收到命令: {command}", file=sys.stderr)  # 调试信息
-            
-            # 处理 LIST 命令（返回工具列表）
-            if command == "LIST":
-                response = {
-                    "tools": tools
-                }
-                # 输出JSON响应 + 换行符（客户端用readline()读取）
-                print(json.dumps(response))
-                sys.stdout.flush()  # 强制刷新，否则客户端收不到
-            
-            # 处理 INVOKE 命令（执行计算）
-            elif command.startswith("INVOKE "):
+            if wire_format == "msgpack":
+                body = read_frame(stdin)
+                if body is None:  # 客户端关闭连接
+                    print("客户端断开连接", file=sys.stderr)
+                    break
                 try:
-                    # 解析参数
-                    payload_str = command[len("INVOKE "):]
-                    payload = json.loads(payload_str)
-                    tool_name = payload["name"]
-                    params = payload["parameters"]
-                    
-                    if tool_name == "calculate":
-                        expression = params.get("expression", "")
-                        # 安全计算（避免eval风险，使用简单表达式解析）
-                        try:
-                            # 仅允许数字和运算符，禁止函数调用
-                            allowed_chars = set("0123456789+-*/(). ")
-                            if not all(c in allowed_chars for c in expression):
-                                raise ValueError("表达式包含不允许的字符")
-                            result = eval(expression)  # 此处仅示例，生产环境需用更安全的方式
-                            response = {"result": float(result)}  # 统一返回浮点数
-                        except Exception as e:
-                            response = {"error": f"计算错误: {str(e)}"}
-                    else:
-                        response = {"error": f"未知工具: {tool_name}"}
-                    
-                    print(json.dumps(response))
-                    sys.stdout.flush()
-                
+                    action, payload = decode_frame(body)
                 except Exception as e:
                     response = {"error": f"解析错误: {str(e)}"}
-                    print(json.dumps(response))
-                    sys.stdout.flush()
-            
-            # 处理未知命令
+                else:
+                    response = handle_request(action, payload, action)
             else:
-                response = {"error": f"未知命令: {command}，支持 LIST 或 INVOKE"}
-                print(json.dumps(response))
-                sys.stdout.flush()
-        
+                # 读取客户端命令（同步读取，更稳定）
+                line = stdin.readline()
+                if not line:  # 客户端关闭连接
+                    print("客户端断开连接", file=sys.stderr)
+                    break
+
+                command = line.decode().strip()
+                print(f"收到命令: {command}", file=sys.stderr)  # 调试信息
+                response = handle_command(command)
+
+            if response is None:
+                continue
+            # 一次写入整条响应再刷新，否则客户端收不到
+            stdout.write(encode_response(response, wire_format))
+            stdout.flush()
+            wire_format = response.get("format", wire_format)
+
         except Exception as e:
             # 捕获所有异常，确保服务不崩溃
             error_msg = f"服务内部错误: {str(e)}\n{traceback.format_exc()}"
-            print(json.dumps({"error": error_msg}))
-            sys.stdout.flush()
+            stdout.write(encode_response({"error": error_msg}, wire_format))
+            stdout.flush()
             print(error_msg, file=sys.stderr)  # 输出到 stderr 用于调试
 
+def _cancelling():
+    """当前任务是否正被调用方取消（Python 3.11 之前无法区分，视为否）"""
+    task = asyncio.current_task()
+    return bool(task is not None and getattr(task, "cancelling", lambda: 0)())
+
+
+class CalculatePool:
+    """
+    有界计算进程池。
+
+    请求超时或被取消时，若任务已在工作进程中运行，则终止整个进程池并换用新池，
+    确保失控的表达式不会继续占用 CPU；被波及的其他任务会在新池中重试一次。
+    """
+
+    def __init__(self, max_workers=None):
+        self.max_workers = max_workers
+        self._pool = ProcessPoolExecutor(max_workers)
+
+    async def run(self, timeout, fn, *args):
+        """在进程池中执行 fn(*args)，超时抛出 asyncio.TimeoutError"""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        for _ in range(2):
+            pool = self._pool
+            future = pool.submit(fn, *args)
+            try:
+                return await asyncio.wait_for(asyncio.wrap_future(future), max(deadline - loop.time(), 0))
+            except BrokenProcessPool:
+                self._recycle(pool)
+            except asyncio.CancelledError:
+                if future.cancelled() and pool is not self._pool and not _cancelling():
+                    continue  # 排队中的任务被其他请求触发的换池取消，并非调用方取消，在新池中重试
+                if future.running():
+                    self._recycle(pool)
+                raise
+            except asyncio.TimeoutError:
+                if future.running():
+                    self._recycle(pool)
+                raise
+        raise RuntimeError("计算进程异常退出")
+
+    def _recycle(self, pool):
+        if pool is not self._pool:
+            return
+        self._pool = ProcessPoolExecutor(self.max_workers)
+        # ProcessPoolExecutor 没有公开的终止接口，只能直接结束其工作进程
+        for process in list(getattr(pool, "_processes", {}).values()):
+            process.terminate()
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+async def serve(max_workers=None, timeout=DEFAULT_TIMEOUT):
+    """
+    并发模式：持续读取命令，把 calculate 交给有界进程池执行，
+    每个响应在完成时立即写回（可能乱序，由 id 关联），stdout 写入串行化。
+    """
+    loop = asyncio.get_running_loop()
+    reader = asyncio.StreamReader(limit=_STREAM_LIMIT)
+    await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), sys.stdin)
+    write_transport, write_protocol = await loop.connect_write_pipe(
+        asyncio.streams.FlowControlMixin, sys.stdout
+    )
+    writer = asyncio.StreamWriter(write_transport, write_protocol, None, loop)
+    write_lock = asyncio.Lock()
+    pool = CalculatePool(max_workers)
+    running = {}  # 请求 id -> 任务，用于 CANCEL
+    tasks = set()
+
+    wire_format = "json"
+
+    async def respond(response):
+        nonlocal wire_format
+        async with write_lock:
+            # 在写锁内按当前格式编码：协商响应之前写出的是 JSON 行，之后的都是新格式
+            try:
+                writer.write(encode_response(response, wire_format))
+                await writer.drain()
+            except (BrokenPipeError, ConnectionResetError):
+                pass  # 客户端已断开
+            wire_format = response.get("format", wire_format)
+
+    def request_timeout(payload):
+        if payload.get("timeout") is None:
+            return timeout
+        return min(timeout, max(float(payload["timeout"]), 0.0))
+
+    async def run_tracked(payload, job):
+        """执行池任务并登记到 running，超时与取消统一转换为错误响应"""
+        limit = request_timeout(payload)
+        request_id = payload.get("id")
+        if request_id is not None:
+            running[request_id] = asyncio.current_task()
+        try:
+            return await job(limit)
+        except asyncio.TimeoutError:
+            return {"error": f"计算错误: 计算超时（超过 {limit} 秒）"}
+        except asyncio.CancelledError:
+            return {"error": "计算错误: 请求已取消"}
+        except RuntimeError as e:
+            return {"error": f"计算错误: {str(e)}"}
+        finally:
+            running.pop(request_id, None)
+
+    async def run_single(expression, limit):
+        return await pool.run(limit, calculate, expression)
+
+    async def run_batch(expressions, limit):
+        # 大批量拆块分发给多个工作进程，整体共享同一超时
+        chunks = [expressions[i:i + BATCH_CHUNK_SIZE] for i in range(0, len(expressions), BATCH_CHUNK_SIZE)]
+        parts = await asyncio.gather(*(pool.run(limit, calculate_batch, chunk) for chunk in chunks))
+        return {"results": [result for part in parts for result in part]}
+
+    async def handle(command):
+        try:
+            action, payload = parse_command(command)
+        except Exception as e:
+            await respond({"error": f"解析错误: {str(e)}"})
+            return
+        await dispatch(action, payload, command)
+
+    async def dispatch(action, payload, command):
+        if action == "CANCEL":
+            task = running.get(payload.get("id"))
+            if task is not None:
+                task.cancel()
+            return
+
+        if action in ("INVOKE", "BATCH_INVOKE"):
+            try:
+                if action == "INVOKE":
+                    tool_name, params = invoke_params(payload)
+                    expression = params.get("expression", "")
+                    job = functools.partial(run_single, expression)
+                else:
+                    tool_name, params_list = batch_params(payload)
+                    expressions = [params.get("expression", "") for params in params_list]
+                    job = functools.partial(run_batch, expressions)
+                request_timeout(payload)
+            except Exception as e:
+                await respond(with_id({"error": f"解析错误: {str(e)}"}, payload))
+                return
+            if tool_name == "calculate":
+                # 并发模式下的耗时包含在进程池中排队的时间
+                started = time.perf_counter()
+                response = await run_tracked(payload, job)
+                await respond(with_id(with_timing(response, payload, started), payload))
+                return
+
+        await respond(handle_request(action, payload, command))
+
+    print("数学服务启动成功（并发模式），等待命令...", file=sys.stderr)
+    try:
+        while True:
+            if wire_format == "msgpack":
+                try:
+                    header = await reader.readexactly(_FRAME_HEADER.size)
+                    body = await reader.readexactly(_FRAME_HEADER.unpack(header)[0])
+                except asyncio.IncompleteReadError:  # 客户端关闭连接
+                    print("客户端断开连接", file=sys.stderr)
+                    break
+                try:
+                    action, payload = decode_frame(body)
+                except Exception as e:
+                    await respond({"error": f"解析错误: {str(e)}"})
+                    continue
+                if action == "LIST":
+                    # LIST 可能切换线路格式，必须处理完再读取下一条
+                    await dispatch(action, payload, action)
+                    continue
+                task = asyncio.ensure_future(dispatch(action, payload, action))
+            else:
+                line = await reader.readline()
+                if not line:  # 客户端关闭连接
+                    print("客户端断开连接", file=sys.stderr)
+                    break
+                command = line.decode().strip()
+                if command.startswith("LIST"):
+                    # LIST 可能切换线路格式，必须处理完再读取下一条
+                    await handle(command)
+                    continue
+                task = asyncio.ensure_future(handle(command))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+        # 输入结束后等待已受理的请求写回结果
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+    finally:
+        pool.shutdown()
+        write_transport.close()
+
+
+def main_async(max_workers=None, timeout=DEFAULT_TIMEOUT):
+    asyncio.run(serve(max_workers, timeout))
+
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Run Math stdio Server")
+    parser.add_argument("--concurrent", action="store_true",
+                        help="Use the asyncio mode with a worker process pool")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Size of the worker process pool (concurrent mode)")
+    parser.add_argument("--timeout", type=float, default=DEFAULT_TIMEOUT,
+                        help="Per-request timeout in seconds (concurrent mode)")
+    args = parser.parse_args()
+
+    if args.concurrent:
+        main_async(args.workers, args.timeout)
+    else:
+        main()
\ No newline at end of file
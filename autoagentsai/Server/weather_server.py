@@ -1,19 +1,106 @@
+import asyncio
+import contextlib
+import importlib.util
+import json
+import time
+from email.utils import parsedate_to_datetime
 from typing import Any, Optional
-from starlette.responses import JSONResponse
+from starlette.responses import JSONResponse, Response
 import httpx
-from mcp.server.fastmcp import FastMCP
+from mcp.server.fastmcp import Context, FastMCP
 from mcp.server import Server  
 from starlette.applications import Starlette
 from mcp.server.sse import SseServerTransport
 from starlette.requests import Request
+from starlette.middleware import Middleware
 from starlette.routing import Mount, Route
-import uvicorn
+
+from autoagentsai.utils import tracing
+from autoagentsai.utils.cache import CacheBackend, TTLCache
+from autoagentsai.utils.metrics import CONTENT_TYPE, MetricsRegistry
+from autoagentsai.utils.singleflight import SingleFlight
+
+
+def cache_ttl(headers: httpx.Headers, default: float) -> float:
+    """根据 Cache-Control / Expires 响应头计算可缓存秒数，缺省时使用 default"""
+    directives = {}
+    for part in headers.get("Cache-Control", "").split(","):
+        name, _, value = part.strip().partition("=")
+        if name:
+            directives[name.lower()] = value.strip('"')
+    if "no-store" in directives or "no-cache" in directives:
+        return 0.0
+
+    age = 0.0
+    try:
+        age = float(headers.get("Age", 0))
+    except ValueError:
+        pass
+
+    for name in ("s-maxage", "max-age"):
+        if name in directives:
+            try:
+                return max(float(directives[name]) - age, 0.0)
+            except ValueError:
+                break
+
+    expires = headers.get("Expires")
+    if expires:
+        try:
+            date = headers.get("Date")
+            now = parsedate_to_datetime(date).timestamp() if date else time.time()
+            return max(parsedate_to_datetime(expires).timestamp() - now, 0.0)
+        except (TypeError, ValueError):
+            return 0.0  # 无法解析的 Expires 视为已过期
+    return default
+
+
+class UpstreamError(Exception):
+    """上游 NWS API 请求失败：超时、连接错误、非 2xx 响应或无法解析的响应体"""
 
 
 class WeatherServer(Server):
     """天气服务类，继承自mcp的Server基类，封装天气相关工具和服务逻辑"""
     
-    def __init__(self, service_name: str = "weather"):
+    def __init__(
+        self,
+        service_name: str = "weather",
+        *,
+        max_connections: int = 100,
+        max_keepalive_connections: int = 20,
+        keepalive_expiry: float = 30.0,
+        http2: bool = True,
+        request_timeout: float = 10.0,
+        points_cache: Optional[CacheBackend] = None,
+        response_cache: Optional[CacheBackend] = None,
+        points_ttl: float = 24 * 3600.0,
+        response_ttl: float = 300.0,
+        max_concurrent_upstream: int = 8,
+        output_format: str = "text",
+        max_alerts: int = 10,
+        max_periods: int = 5,
+        max_field_chars: int = 400,
+    ):
+        """
+        Args:
+            service_name: 服务名称
+            max_connections: 上游连接池的最大连接数
+            max_keepalive_connections: 连接池中保持空闲的最大长连接数
+            keepalive_expiry: 空闲长连接的保留时间（秒）
+            http2: 是否启用 HTTP/2（需安装 h2，未安装时自动回退到 HTTP/1.1）
+            request_timeout: 单次上游请求超时（秒），超时以 UpstreamError 报告给调用方
+            points_cache: 坐标 -> 预报地址的缓存后端，默认进程内 TTLCache
+            response_cache: 预报与警报响应的缓存后端，默认进程内 TTLCache
+            points_ttl: 坐标映射的缓存时间（秒），网格映射几乎不变，默认一天
+            response_ttl: 上游未给出 Cache-Control/Expires 时响应的缓存时间（秒）
+            max_concurrent_upstream: 批量工具同时查询的地点/州数量上限
+            output_format: 单项工具的输出格式，"text" 为紧凑文本，"json" 为结构化 JSON
+            max_alerts: 每个州最多返回的警报条数
+            max_periods: 每个地点最多返回的预报时段数
+            max_field_chars: 描述等长文本字段的最大字符数（0 表示不截断）
+        """
+        if output_format not in ("text", "json"):
+            raise ValueError("output_format must be 'text' or 'json'")
         super().__init__(service_name)  # 调用父类初始化
         self.mcp = FastMCP(service_name)  # 初始化FastMCP实例
         self._register_tools()  # 注册天气工具
@@ -22,176 +109,494 @@ class WeatherServer(Server):
         self.NWS_API_BASE = "https://api.weather.gov"
         self.USER_AGENT = "weather-app/1.0"
 
+        # 上游连接池配置；客户端常驻复用，避免每次请求重新握手
+        self.http_limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry,
+        )
+        self.http2 = http2 and importlib.util.find_spec("h2") is not None
+        self.request_timeout = request_timeout
+        self._http_client: Optional[httpx.AsyncClient] = None
+
+        # 两级缓存：长 TTL 的网格映射 + 遵循上游缓存头的短 TTL 响应
+        self.points_cache = points_cache if points_cache is not None else TTLCache(maxsize=4096)
+        self.response_cache = response_cache if response_cache is not None else TTLCache(maxsize=1024)
+        self.points_ttl = points_ttl
+        self.response_ttl = response_ttl
+        # 并发的相同上游请求合并为一次
+        self._inflight = SingleFlight()
+        self.max_concurrent_upstream = max_concurrent_upstream
+        self._batch_semaphore: Optional[asyncio.Semaphore] = None
+
+        # 工具输出会作为观察结果回填给 LLM，控制其体积即控制 token 开销
+        self.output_format = output_format
+        self.max_alerts = max_alerts
+        self.max_periods = max_periods
+        self.max_field_chars = max_field_chars
+
+        # 运维指标，由 create_starlette_app 的 /metrics 路由以 Prometheus 文本格式导出
+        self.metrics = MetricsRegistry()
+        self._tool_calls = self.metrics.counter(
+            "weather_tool_calls_total", "MCP tool calls by tool and outcome", ("tool", "outcome"))
+        self._tool_latency = self.metrics.histogram(
+            "weather_tool_duration_seconds", "MCP tool call latency", ("tool",))
+        self._cache_lookups = self.metrics.counter(
+            "weather_upstream_cache_lookups_total", "Upstream cache lookups by cache and result", ("cache", "result"))
+        self._cache_hit_ratio = self.metrics.gauge(
+            "weather_upstream_cache_hit_ratio", "Fraction of upstream cache lookups served from cache", ("cache",))
+        self._upstream_requests = self.metrics.counter(
+            "weather_upstream_requests_total", "Requests sent to the NWS API by status", ("status",))
+        self._upstream_latency = self.metrics.histogram(
+            "weather_upstream_request_duration_seconds", "NWS API request latency")
+        self._upstream_in_flight = self.metrics.gauge(
+            "weather_upstream_requests_in_flight", "NWS API requests currently in flight")
+
     def _register_tools(self) -> None:
-        """注册天气相关工具（get_alerts和get_forecast）"""
+        """注册天气相关工具（get_alerts、get_forecast 及其批量版本）"""
         # 用类方法注册工具，绑定到当前实例
         @self.mcp.tool()
-        async def get_alerts(state: str) -> str:
+        async def get_alerts(state: str, ctx: Context) -> str:
             """Get weather alerts for a US state.
             
             Args:
                 state: Two-letter US state code (e.g. CA, NY)
             """
-            return await self._get_alerts_impl(state)
+            with self._observe_tool(ctx, "get_alerts"):
+                return await self._get_alerts_impl(state)
 
         @self.mcp.tool()
-        async def get_forecast(latitude: float, longitude: float) -> str:
+        async def get_forecast(latitude: float, longitude: float, ctx: Context) -> str:
             """Get weather forecast for a location.
             
             Args:
                 latitude: Latitude of the location
                 longitude: Longitude of the location
             """
-            return await self._get_forecast_impl(latitude, longitude)
+            with self._observe_tool(ctx, "get_forecast"):
+                return await self._get_forecast_impl(latitude, longitude)
 
-    async def _make_nws_request(self, url: str) -> Optional[dict[str, Any]]:
-        """内部工具方法：向NWS API发送请求（封装复用）"""
-        headers = {
-            "User-Agent": self.USER_AGENT,
-            "Accept": "application/geo+json"
-        }
+        @self.mcp.tool()
+        async def get_forecasts(locations: list[dict[str, float]], ctx: Context) -> str:
+            """Get weather forecasts for several locations in one call.
+            
+            Args:
+                locations: List of objects with "latitude" and "longitude" keys
+            """
+            with self._observe_tool(ctx, "get_forecasts"):
+                return await self._get_forecasts_impl(locations)
+
+        @self.mcp.tool()
+        async def get_alerts_multi(states: list[str], ctx: Context) -> str:
+            """Get weather alerts for several US states in one call.
+            
+            Args:
+                states: List of two-letter US state codes (e.g. ["CA", "NY"])
+            """
+            with self._observe_tool(ctx, "get_alerts_multi"):
+                return await self._get_alerts_multi_impl(states)
+
+    @contextlib.contextmanager
+    def _observe_tool(self, ctx: Context, tool: str):
+        """
+        记录工具调用次数与延迟；开启追踪时同时生成 span，
+        以客户端随请求 _meta 传来的 traceparent 作为父节点
+        """
+        started = time.perf_counter()
+        outcome = "error"
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.get(url, headers=headers, timeout=30.0)
-                response.raise_for_status()
-                return response.json()
-        except Exception:
+            if tracing.is_enabled():
+                meta = ctx.request_context.meta
+                with tracing.remote_parent(meta.model_extra if meta is not None else None), \
+                        tracing.span(f"weather.{tool}"):
+                    yield
+            else:
+                yield
+            outcome = "ok"
+        finally:
+            self._tool_calls.inc(tool=tool, outcome=outcome)
+            self._tool_latency.observe(time.perf_counter() - started, tool=tool)
+
+    def _record_cache_lookup(self, cache: str, hit: bool) -> None:
+        self._cache_lookups.inc(cache=cache, result="hit" if hit else "miss")
+        hits = self._cache_lookups.value(cache=cache, result="hit")
+        self._cache_hit_ratio.set(hits / (hits + self._cache_lookups.value(cache=cache, result="miss")), cache=cache)
+
+    def get_http_client(self) -> httpx.AsyncClient:
+        """共享的上游 HTTP 客户端（长连接、连接池），首次访问时创建"""
+        if self._http_client is None or self._http_client.is_closed:
+            self._http_client = httpx.AsyncClient(
+                http2=self.http2,
+                limits=self.http_limits,
+                timeout=self.request_timeout,
+                headers={
+                    "User-Agent": self.USER_AGENT,
+                    "Accept": "application/geo+json"
+                },
+            )
+        return self._http_client
+
+    async def startup(self) -> None:
+        """随应用启动预先创建连接池"""
+        self.get_http_client()
+
+    async def shutdown(self) -> None:
+        """随应用关闭释放连接池"""
+        if self._http_client is not None:
+            await self._http_client.aclose()
+            self._http_client = None
+
+    async def _make_nws_request(self, url: str, cache: Optional[CacheBackend] = None) -> Optional[dict[str, Any]]:
+        """内部工具方法：向NWS API发送请求（封装复用），传入 cache 时按响应头缓存结果"""
+        with tracing.span("nws.lookup", url=url) as span:
+            if cache is not None:
+                cached = cache.get(url)
+                self._record_cache_lookup("response", cached is not None)
+                if cached is not None:
+                    span.set_attribute("cache", "hit")
+                    return cached
+            span.set_attribute("cache", "miss")
+            return await self._inflight.do(url, lambda: self._fetch_nws(url, cache))
+
+    async def _fetch_nws(self, url: str, cache: Optional[CacheBackend]) -> Optional[dict[str, Any]]:
+        """
+        实际发起上游请求；同一 URL 的并发调用经 single-flight 合并后只执行一次。
+
+        404 表示该地点/州没有数据，返回 None；其余失败抛出 UpstreamError，
+        由工具把具体原因返回给调用方，而不是伪装成“没有数据”。
+        """
+        # single-flight 合并的调用中只有实际发请求的一方会记录该 span
+        with tracing.span("nws.http", url=url) as span:
+            status = "error"
+            started = time.perf_counter()
+            self._upstream_in_flight.inc()
+            try:
+                response = await self.get_http_client().get(url)
+                status = response.status_code
+            except httpx.TimeoutException as e:
+                status = "timeout"
+                raise UpstreamError(f"NWS API timed out after {self.request_timeout}s: {url}") from e
+            except httpx.HTTPError as e:
+                raise UpstreamError(f"NWS API request failed: {url}: {e!r}") from e
+            finally:
+                self._upstream_in_flight.dec()
+                self._upstream_requests.inc(status=status)
+                self._upstream_latency.observe(time.perf_counter() - started)
+            span.set_attribute("status", response.status_code)
+        if response.status_code == 404:
             return None
+        if response.is_error:
+            raise UpstreamError(f"NWS API returned HTTP {response.status_code}: {url}")
+        try:
+            data = response.json()
+        except ValueError as e:
+            raise UpstreamError(f"NWS API returned an invalid response: {url}") from e
+        if cache is not None:
+            cache.set(url, data, cache_ttl(response.headers, self.response_ttl))
+        return data
+
+    async def _get_forecast_url(self, latitude: float, longitude: float) -> Optional[str]:
+        """查询坐标对应的预报地址；NWS 网格精度为 4 位小数，按此取整作为缓存键"""
+        key = f"{round(latitude, 4)},{round(longitude, 4)}"
+        forecast_url = self.points_cache.get(key)
+        self._record_cache_lookup("points", forecast_url is not None)
+        if forecast_url is not None:
+            return forecast_url
+
+        points_data = await self._make_nws_request(f"{self.NWS_API_BASE}/points/{key}")
+        if not points_data:
+            return None
+        forecast_url = points_data["properties"]["forecast"]
+        self.points_cache.set(key, forecast_url, self.points_ttl)
+        return forecast_url
 
     @staticmethod
-    def _format_alert(feature: dict) -> str:
-        """格式化天气警报信息"""
+    def _truncate(text: Any, limit: int) -> str:
+        """折叠空白（NWS 文本带硬换行）并截断到 limit 个字符"""
+        text = " ".join(str(text).split())
+        if limit and len(text) > limit:
+            return text[:limit - 1].rstrip() + "…"
+        return text
+
+    def _dumps(self, data: Any) -> str:
+        return json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+
+    def _alert_summary(self, feature: dict) -> dict:
+        """提取警报的关键字段，长文本按 max_field_chars 截断"""
         props = feature["properties"]
-        return f"""
-        Event: {props.get('event', 'Unknown')}
-        Area: {props.get('areaDesc', 'Unknown')}
-        Severity: {props.get('severity', 'Unknown')}
-        Description: {props.get('description', 'No description available')}
-        Instructions: {props.get('instruction', 'No specific instructions provided')}
-        """
+        limit = self.max_field_chars
+        return {
+            "event": props.get("event") or "Unknown",
+            "area": self._truncate(props.get("areaDesc") or "Unknown", limit),
+            "severity": props.get("severity") or "Unknown",
+            "description": self._truncate(props.get("description") or "No description available", limit),
+            "instruction": self._truncate(props.get("instruction") or "No specific instructions provided", limit),
+        }
 
-    async def _get_alerts_impl(self, state: str) -> str:
-        """获取天气警报的具体实现（内部调用）"""
+    def _period_summary(self, period: dict) -> dict:
+        """提取预报时段的关键字段"""
+        return {
+            "name": period["name"],
+            "temperature": f"{period['temperature']}°{period['temperatureUnit']}",
+            "wind": f"{period['windSpeed']} {period['windDirection']}",
+            "forecast": self._truncate(period["detailedForecast"], self.max_field_chars),
+        }
+
+    @staticmethod
+    def _format_alert(alert: dict) -> str:
+        """格式化天气警报信息"""
+        return (
+            f"Event: {alert['event']}\n"
+            f"Area: {alert['area']}\n"
+            f"Severity: {alert['severity']}\n"
+            f"Description: {alert['description']}\n"
+            f"Instructions: {alert['instruction']}"
+        )
+
+    async def _fetch_alerts(self, state: str) -> dict:
+        """获取一个州的警报并裁剪为结构化结果（最多 max_alerts 条）"""
+        # 统一州代码大小写，使并发请求与缓存能命中同一键
+        state = state.strip().upper()
         url = f"{self.NWS_API_BASE}/alerts/active/area/{state}"
-        data = await self._make_nws_request(url)
+        data = await self._make_nws_request(url, self.response_cache)
 
         if not data or "features" not in data:
-            return "Unable to fetch alerts or no alerts found."
-        if not data["features"]:
-            return "No active alerts for this state."
-
-        alerts = [self._format_alert(feature) for feature in data["features"]]
-        return "\n---\n".join(alerts)
+            return {"state": state, "error": "Unable to fetch alerts or no alerts found."}
+        features = data["features"]
+        return {
+            "state": state,
+            "total": len(features),
+            "alerts": [self._alert_summary(feature) for feature in features[:self.max_alerts]],
+        }
 
-    async def _get_forecast_impl(self, latitude: float, longitude: float) -> str:
-        """获取天气预报的具体实现（内部调用）"""
+    async def _fetch_forecast(self, latitude: float, longitude: float) -> dict:
+        """获取一个地点的预报并裁剪为结构化结果（最多 max_periods 个时段）"""
         # 先获取预报网格端点
-        points_url = f"{self.NWS_API_BASE}/points/{latitude},{longitude}"
-        points_data = await self._make_nws_request(points_url)
-        if not points_data:
-            return "Unable to fetch forecast data for this location."
+        forecast_url = await self._get_forecast_url(latitude, longitude)
+        if not forecast_url:
+            return {"error": "Unable to fetch forecast data for this location."}
 
         # 再获取具体预报
-        forecast_url = points_data["properties"]["forecast"]
-        forecast_data = await self._make_nws_request(forecast_url)
+        forecast_data = await self._make_nws_request(forecast_url, self.response_cache)
         if not forecast_data:
-            return "Unable to fetch detailed forecast."
+            return {"error": "Unable to fetch detailed forecast."}
 
-        # 格式化预报信息（取前5个时段）
         periods = forecast_data["properties"]["periods"]
-        forecasts = []
-        for period in periods[:5]:
-            forecast = f"""
-            {period['name']}:
-            Temperature: {period['temperature']}°{period['temperatureUnit']}
-            Wind: {period['windSpeed']} {period['windDirection']}
-            Forecast: {period['detailedForecast']}
-            """
-            forecasts.append(forecast)
-        return "\n---\n".join(forecasts)
+        return {"periods": [self._period_summary(period) for period in periods[:self.max_periods]]}
+
+    def _render_alerts(self, result: dict) -> str:
+        if self.output_format == "json":
+            return self._dumps(result)
+        if "error" in result:
+            return result["error"]
+        if not result["alerts"]:
+            return "No active alerts for this state."
+        text = "\n---\n".join(self._format_alert(alert) for alert in result["alerts"])
+        omitted = result["total"] - len(result["alerts"])
+        if omitted > 0:
+            text += f"\n---\n({omitted} more alerts omitted)"
+        return text
+
+    def _render_forecast(self, result: dict) -> str:
+        if self.output_format == "json":
+            return self._dumps(result)
+        if "error" in result:
+            return result["error"]
+        return "\n".join(
+            f"{period['name']}: {period['temperature']}, wind {period['wind']}. {period['forecast']}"
+            for period in result["periods"]
+        )
+
+    async def _get_alerts_impl(self, state: str) -> str:
+        """获取天气警报的具体实现（内部调用）"""
+        return self._render_alerts(await self._fetch_alerts(state))
+
+    async def _get_forecast_impl(self, latitude: float, longitude: float) -> str:
+        """获取天气预报的具体实现（内部调用）"""
+        return self._render_forecast(await self._fetch_forecast(latitude, longitude))
+
+    async def _bounded_gather(self, coroutines: list) -> list:
+        """并发执行多个查询，同时在途的数量不超过 max_concurrent_upstream"""
+        if self._batch_semaphore is None:
+            self._batch_semaphore = asyncio.Semaphore(self.max_concurrent_upstream)
+
+        async def run(coroutine):
+            async with self._batch_semaphore:
+                try:
+                    return await coroutine
+                except UpstreamError as e:
+                    # 批量结果中单项的上游失败不影响其他项
+                    return {"error": str(e)}
+
+        return await asyncio.gather(*(run(coroutine) for coroutine in coroutines))
+
+    @staticmethod
+    def _coordinates(location: Any) -> Optional[tuple]:
+        """取出地点的 (latitude, longitude)，缺少字段或不是数值时返回 None"""
+        if not isinstance(location, dict):
+            return None
+        coordinates = (location.get("latitude"), location.get("longitude"))
+        if not all(isinstance(value, (int, float)) and not isinstance(value, bool) for value in coordinates):
+            return None
+        return coordinates
+
+    async def _get_forecasts_impl(self, locations: list[dict[str, float]]) -> str:
+        """批量获取多个地点的天气预报，结果按输入顺序合并为 JSON；无效的地点只使该项返回错误"""
+        coordinates = [self._coordinates(location) for location in locations]
+        fetched = iter(await self._bounded_gather([
+            self._fetch_forecast(latitude, longitude) for latitude, longitude in filter(None, coordinates)
+        ]))
+        results = []
+        for location, point in zip(locations, coordinates):
+            if point is None:
+                given = {key: location[key] for key in ("latitude", "longitude")
+                         if isinstance(location, dict) and key in location}
+                results.append({**given, "error": 'Location must have numeric "latitude" and "longitude".'})
+            else:
+                results.append({"latitude": point[0], "longitude": point[1], **next(fetched)})
+        return self._dumps({"results": results})
+
+    async def _get_alerts_multi_impl(self, states: list[str]) -> str:
+        """批量获取多个州的天气警报，结果按输入顺序合并为 JSON"""
+        results = await self._bounded_gather([self._fetch_alerts(state) for state in states])
+        return self._dumps({"results": results})
 
     def get_mcp_server(self):
         """获取内部的mcp服务器实例，用于启动服务"""
         return self.mcp._mcp_server  # 暴露内部服务实例（保持原有逻辑）
 
 
+class HttpMetricsMiddleware:
+    """
+    ASGI 中间件：按路由和状态码统计 HTTP 请求数与延迟。
+
+    /sse 是长连接，只在响应开始时计数，不计入延迟直方图；未知路径统一记为 "other"，避免标签基数膨胀。
+    """
+
+    ROUTES = ("/sse", "/messages/", "/tools", "/metrics")
+
+    def __init__(self, app, metrics: MetricsRegistry):
+        self.app = app
+        self.requests = metrics.counter(
+            "weather_http_requests_total", "HTTP requests by route and status", ("route", "status"))
+        self.latency = metrics.histogram(
+            "weather_http_request_duration_seconds", "HTTP request latency (excluding /sse streams)", ("route",))
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        route = next((route for route in self.ROUTES if scope["path"].startswith(route)), "other")
+        started = time.perf_counter()
+        status = None
+
+        async def send_with_status(message):
+            nonlocal status
+            # /sse 结束后 handle_sse 返回的空响应会再发一次 response.start，只统计第一次
+            if message["type"] == "http.response.start" and status is None:
+                status = message["status"]
+                self.requests.inc(route=route, status=status)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            if status is None:
+                self.requests.inc(route=route, status=500)
+            if route != "/sse":
+                self.latency.observe(time.perf_counter() - started, route=route)
+
+
 def create_starlette_app(weather_server: WeatherServer, *, debug: bool = False) -> Starlette:
     """创建Starlette应用，绑定天气服务的SSE通信"""
     sse = SseServerTransport("/messages/")
 
-    async def handle_sse(request: Request) -> None:
-        async with sse.connect_sse(
-                request.scope,
-                request.receive,
-                request._send,  # noqa: SLF001
-        ) as (read_stream, write_stream):
-            await weather_server.get_mcp_server().run(
-                read_stream,
-                write_stream,
-                weather_server.get_mcp_server().create_initialization_options(),
-            )
+    @contextlib.asynccontextmanager
+    async def lifespan(app: Starlette):
+        # 上游连接池的生命周期与应用一致
+        await weather_server.startup()
+        try:
+            yield
+        finally:
+            await weather_server.shutdown()
+
+    sse_sessions = weather_server.metrics.gauge("weather_sse_sessions_active", "Open MCP SSE sessions")
+
+    async def handle_sse(request: Request) -> Response:
+        sse_sessions.inc()
+        try:
+            async with sse.connect_sse(
+                    request.scope,
+                    request.receive,
+                    request._send,  # noqa: SLF001
+            ) as (read_stream, write_stream):
+                await weather_server.get_mcp_server().run(
+                    read_stream,
+                    write_stream,
+                    weather_server.get_mcp_server().create_initialization_options(),
+                )
+        finally:
+            sse_sessions.dec()
+        # 客户端断开后 SSE 响应已发送完毕，返回空响应让路由正常收尾
+        return Response()
     
-    # 修复工具列表端点
+    # 工具列表端点：直接读取 FastMCP 中注册的工具
     async def handle_tools(request: Request) -> JSONResponse:
-        # 获取工具列表的正确方式（根据mcp库API调整）
         try:
-            # 使用反射获取工具列表（假设存在get_tools方法）
-            tool_manager = weather_server.get_mcp_server()
-            tools_method = getattr(tool_manager, "get_tools", None)
-            
-            if callable(tools_method):
-                tools = tools_method()
-            else:
-                # 回退方案：手动定义工具
-                tools = [
-                    {
-                        "name": "get_forecast",
-                        "parameters": {
-                            "type": "object",
-                            "properties": {
-                                "latitude": {"type": "number"},
-                                "longitude": {"type": "number"}
-                            },
-                            "required": ["latitude", "longitude"]
-                        },
-                        "description": "Get weather forecast for a location."
-                    },
-                    {
-                        "name": "get_alerts",
-                        "parameters": {
-                            "type": "object",
-                            "properties": {
-                                "state": {"type": "string"}
-                            },
-                            "required": ["state"]
-                        },
-                        "description": "Get weather alerts for a US state."
-                    }
-                ]
-            
+            tools = [
+                {
+                    "name": tool.name,
+                    "description": tool.description,
+                    "parameters": tool.inputSchema,
+                }
+                for tool in await weather_server.mcp.list_tools()
+            ]
             return JSONResponse({"tools": tools})
         except Exception as e:
             return JSONResponse({"error": str(e)}, status_code=500)
 
+    # Prometheus 指标端点
+    async def handle_metrics(request: Request) -> Response:
+        return Response(weather_server.metrics.render(), headers={"Content-Type": CONTENT_TYPE})
+
     return Starlette(
         debug=debug,
         routes=[
             Route("/sse", endpoint=handle_sse),
             Mount("/messages/", app=sse.handle_post_message),
             Route("/tools", endpoint=handle_tools),  # 工具列表端点
+            Route("/metrics", endpoint=handle_metrics),
         ],
+        middleware=[Middleware(HttpMetricsMiddleware, metrics=weather_server.metrics)],
+        lifespan=lifespan,
     )
 
 if __name__ == "__main__":
-    # 实例化天气服务（现在可以被其他模块导入的WeatherServer）
-    weather_server = WeatherServer()
-
     import argparse
+
+    import uvicorn
+
     parser = argparse.ArgumentParser(description='Run Weather MCP SSE Server')
     parser.add_argument('--host', default='127.0.0.1', help='Host to bind to')
     parser.add_argument('--port', type=int, default=8888, help='Port to listen on')
+    parser.add_argument('--max-connections', type=int, default=100, help='Upstream connection pool size')
+    parser.add_argument('--max-keepalive', type=int, default=20, help='Idle keep-alive connections to retain')
+    parser.add_argument('--no-http2', action='store_true', help='Disable HTTP/2 to the upstream API')
+    parser.add_argument('--output-format', choices=['text', 'json'], default='text', help='Tool output format')
+    parser.add_argument('--max-alerts', type=int, default=10, help='Maximum alerts returned per state')
+    parser.add_argument('--upstream-timeout', type=float, default=10.0, help='Timeout for each upstream request')
     args = parser.parse_args()
 
+    # 实例化天气服务（现在可以被其他模块导入的WeatherServer）
+    weather_server = WeatherServer(
+        max_connections=args.max_connections,
+        max_keepalive_connections=args.max_keepalive,
+        http2=not args.no_http2,
+        output_format=args.output_format,
+        max_alerts=args.max_alerts,
+        request_timeout=args.upstream_timeout,
+    )
+
     # 创建并启动应用
     starlette_app = create_starlette_app(weather_server, debug=True)
     uvicorn.run(starlette_app, host=args.host, port=args.port)
\ No newline at end of file
@@ -1,6 +1,18 @@
 # AutoAgentsAI package
-from . import client
-from . import prebuilt
-from . import Server
+#
+# 子包在首次访问时才导入（PEP 562），只使用客户端的进程不会加载 langchain、Starlette 等依赖。
+import importlib
 
-__all__ = ["client", "prebuilt", "Server"] 
\ No newline at end of file
+__all__ = ["client", "prebuilt", "Server", "utils"]
+
+
+def __getattr__(name):
+    if name in __all__:
+        module = importlib.import_module(f".{name}", __name__)
+        globals()[name] = module
+        return module
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
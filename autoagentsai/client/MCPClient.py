@@ -1,354 +1,601 @@
 import asyncio
+import contextlib
+import copy
+import itertools
 import json
-import os
-import traceback
-from typing import Optional
-from contextlib import AsyncExitStack
-from mcp import ClientSession, StdioServerParameters
-from mcp.client.stdio import stdio_client
-from openai import OpenAI
-from dotenv import load_dotenv
-load_dotenv()  # load environment variables from .env
+import logging
+import math
+import time
+
+from autoagentsai.utils import deadline as deadlines, tracing
+from autoagentsai.utils.cache import TTLCache
+from autoagentsai.utils.metrics import MetricsRegistry
+from autoagentsai.utils.singleflight import SingleFlight
+
+from .admission import AdmissionController
+from .catalog import MCPTool, ToolCatalog, ToolSchemaCache
+from .errors import (CircuitOpenError, MCPTimeoutError, MCPToolError, MCPTransportError,
+                     ServerOverloadedError)
+from .resilience import CircuitBreaker, RetryPolicy
+from .stdio_transport import StdioTransport
+
+logger = logging.getLogger(__name__)
 
 class MCPClient():
     """
     MCPClient is a client for interacting with MCP (Multi-Channel Protocol) servers.
     It allows you to initialize tools based on the MCP configuration and interact with them.
     """
-    def __init__(self, tools_config):
+    def __init__(self, tools_config, *, discovery_timeout=10.0, tools_ttl=None, tools_cache_dir=None,
+                 idle_timeout=None, result_cache_size=1024, max_in_flight=None, max_queue=None,
+                 queue_timeout=None, call_timeout=None, retry=None, circuit_breaker=None):
         """
         初始化MCPClient，解析传入的工具配置。
         
         :param tools_config: 字典，包含多个工具的配置。
+        :param discovery_timeout: 单个服务工具发现的超时（秒），可在服务配置中用 discovery_timeout 覆盖
+        :param tools_ttl: 工具目录缓存的存活时间（秒），None 表示直到失效通知或版本变化前一直有效
+        :param tools_cache_dir: 工具目录的磁盘缓存目录（如 "~/.cache/autoagentsai"），
+            设置后冷启动直接使用磁盘缓存构建工具，服务在首次真正调用时才启动并在后台重新验证
+        :param idle_timeout: 服务空闲多少秒后自动关闭（下次调用时重新启动），None 表示不回收；
+            可在服务配置中用 idle_timeout 单独设置
+        :param result_cache_size: 工具结果缓存的最大条目数（LRU）。结果缓存默认关闭，
+            在服务配置的 "cache" 中按工具开启，例如
+            {"calculate": {"pure": True}, "get_alerts": {"ttl": 60}}：
+            pure 表示结果只取决于参数、可一直复用，ttl 为结果的有效秒数
+        :param max_in_flight: 每个服务同时在途的调用上限，超出的调用排队；None 表示不限制
+        :param max_queue: 每个服务排队调用数上限，队列满时立即抛出 ServerOverloadedError；None 表示不限
+        :param queue_timeout: 单个调用最多排队的秒数，预计排队时间超过它时直接拒绝；
+            以上三项均可在服务配置中单独设置
+        :param call_timeout: 单次调用的截止时间（秒），包含排队、重试与退避；截止时间随请求传给服务端，
+            超时后通知服务端取消并抛出 MCPTimeoutError。服务配置中可用 call_timeout 覆盖，
+            并用 tool_timeouts（{工具名: 秒}）为单个工具设置
+        :param retry: 重试策略，例如 {"attempts": 3, "base_delay": 0.1, "max_delay": 2.0}（指数退避 + 抖动）；
+            只有幂等工具会重试：服务配置 idempotent 中列出的工具，或在 cache 中声明为 pure 的工具
+        :param circuit_breaker: 熔断配置，例如 {"failure_threshold": 5, "recovery_timeout": 30}；
+            服务连续传输失败后直接拒绝调用，经过 recovery_timeout 秒后放行探测调用，成功即恢复
         """
         self.tools = {}
+        self.discovery_timeout = discovery_timeout
+        self.idle_timeout = idle_timeout
+        # 已启动的传输层实例，按服务名缓存，跨调用复用；服务在首次使用时才启动
+        self._transports = {}
+        # 每个服务的在途调用数与最近使用时间，用于空闲回收
+        self._active = {}
+        self._last_used = {}
+        self._reaper = None
+        # 已发现的工具目录；并发的发现请求按服务合并
+        self._catalog = ToolCatalog(ttl=tools_ttl)
+        self._discovery = SingleFlight()
+        self._schema_cache = ToolSchemaCache(tools_cache_dir) if tools_cache_dir else None
+        # 工具目录来自磁盘缓存、尚未与服务核对的服务名
+        self._unverified = set()
+        # 内存目录加载过的服务名；之后的失效（refresh、list_changed、TTL）直接向服务查询，不再读磁盘缓存
+        self._loaded = set()
+        self._background = set()
+        # 工具结果缓存：键为 (服务, 工具, 规范化参数)；相同参数的并发调用合并为一次
+        self._results = TTLCache(maxsize=result_cache_size)
+        self._result_flight = SingleFlight()
+        # 每个服务的准入控制器，首次调用时按配置创建
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._admission = {}
+        # 超时、重试与熔断；熔断器按服务在首次调用时创建
+        self.call_timeout = call_timeout
+        self.retry = retry
+        self.circuit_breaker = circuit_breaker
+        self._breakers = {}
+        # 按服务统计的调用结果与延迟，由 stats() 汇总，metrics_text() 导出为 Prometheus 文本格式
+        self._metrics = MetricsRegistry()
+        self._calls = self._metrics.counter(
+            "mcp_client_calls_total", "Tool calls by server and outcome", ("server", "outcome"))
+        self._latency = self._metrics.histogram(
+            "mcp_client_call_duration_seconds", "Tool call latency including queueing and retries", ("server",))
+        self._in_flight_gauge = self._metrics.gauge(
+            "mcp_client_calls_in_flight", "Tool calls currently executing", ("server",))
+        self._queued_gauge = self._metrics.gauge(
+            "mcp_client_calls_queued", "Tool calls waiting for admission", ("server",))
         
         for tool_name, tool_config in tools_config.items():
             # 解析每个工具的配置
             self.tools[tool_name] = tool_config
         
-    def get_tools(self):
-        """
-        获取已初始化的所有工具对象列表。
-        
-        :return: 工具对象列表，每个对象包含name, description等属性。
+    async def get_tools(self, refresh=False):
         """
-        tool_objects = []
+        并发地从所有已配置的服务发现工具，返回工具对象列表。
         
-        for tool_name, tool_config in self.tools.items():
-            # 创建工具对象
-            tool = type('Tool', (object,), {
-                'name': tool_name,
-                'description': tool_config.get('description', ''),
-                'parameters': tool_config.get('parameters', {}),
-                # 添加其他必要属性
-            })
-            tool_objects.append(tool)
+        结果缓存在工具目录中，重复调用不会重复请求服务；目录在超过 tools_ttl、
+        配置中的 version 变化或收到 tools/list_changed 通知时失效。发现失败的服务会被跳过。
         
-        return tool_objects
+        :param refresh: 为 True 时忽略缓存重新发现
+        :return: MCPTool 列表，每个对象包含 name, description, parameters 等属性，可通过 arun 调用
+        """
+        if refresh:
+            self._catalog.invalidate()
+        server_names = list(self.tools)
+        results = await asyncio.gather(
+            *(self._discover(server_name) for server_name in server_names),
+            return_exceptions=True,
+        )
 
+        discovered = []
+        for server_name, result in zip(server_names, results):
+            if isinstance(result, Exception):
+                logger.warning("Error getting tools from %s: %r", server_name, result)
+                continue
+            discovered.extend((server_name, tool_info) for tool_info in result)
+        return self._build_tools(discovered)
 
+    def _build_tools(self, discovered):
+        """创建工具对象；不同服务存在同名工具时以 "服务名_工具名" 区分"""
+        counts = {}
+        for _, tool_info in discovered:
+            counts[tool_info["name"]] = counts.get(tool_info["name"], 0) + 1
+        return [
+            MCPTool(
+                self,
+                server_name,
+                tool_info["name"],
+                tool_info.get("description", ""),
+                tool_info.get("parameters"),
+                name=tool_info["name"] if counts[tool_info["name"]] == 1 else f"{server_name}_{tool_info['name']}",
+            )
+            for server_name, tool_info in discovered
+        ]
 
-# # autoagentsai/client.py
+    async def _discover(self, server_name):
+        """读取单个服务的工具目录，缓存缺失或失效时才向服务查询"""
+        config = self.tools[server_name]
+        tools = self._catalog.get(server_name, config.get("version"))
+        if tools is not None:
+            return tools
+        if self._schema_cache is not None and server_name not in self._loaded:
+            entry = self._schema_cache.load(server_name, config)
+            if entry is not None:
+                # 冷启动时先用磁盘缓存，不启动服务；待服务因真实调用启动后再后台核对
+                self._catalog.put(server_name, entry["tools"], config.get("version"))
+                self._loaded.add(server_name)
+                self._unverified.add(server_name)
+                return entry["tools"]
+        return await self._discovery.do(server_name, lambda: self._fetch_tools(server_name))
 
-# import asyncio
-# import subprocess
-# import json
-# from typing import List, Dict, Any, Union, Optional
-# from langchain_core.tools import BaseTool
-# import websockets
-# import httpx
+    async def _fetch_tools(self, server_name):
+        config = self.tools[server_name]
+        timeout = config.get("discovery_timeout", self.discovery_timeout)
 
-# class MCPClient:
-#     """
-#     多服务MCP客户端，支持读取配置并将不同服务转换为LangChain工具
-#     """
-    
-#     def __init__(self, service_configs: Dict[str, Dict[str, Any]]):
-#         self.service_configs = service_configs
-#         self.services = {}
-        
-#         # 初始化各个服务
-#         for service_name, config in service_configs.items():
-#             transport = config.get("transport")
-            
-#             if transport == "stdio":
-#                 self.services[service_name] = StdioServiceClient(config)
-#             elif transport == "streamable_http":
-#                 self.services[service_name] = StreamableHttpServiceClient(config)
-#             elif transport == "websocket":
-#                 self.services[service_name] = WebSocketServiceClient(config)
-#             else:
-#                 raise ValueError(f"Unsupported transport type '{transport}' for {service_name} service")
-    
-#     async def get_tools(self) -> List[BaseTool]:
-#         """获取所有服务的工具列表"""
-#         tools = []
-        
-#         for service_name, service_client in self.services.items():
-#             try:
-#                 service_tools = await service_client.get_tools()
-#                 for tool_info in service_tools:
-#                     tool = self._create_langchain_tool(service_name, tool_info)
-#                     tools.append(tool)
-#             except Exception as e:
-#                 print(f"Error getting tools from {service_name}: {e}")
-        
-#         return tools
-    
-#     def _create_langchain_tool(self, service_name: str, tool_info: Dict[str, Any]) -> BaseTool:
-#         """
-#         根据工具信息创建LangChain工具对象
-#         """
-#         tool_name = tool_info.get("name", f"unnamed_tool_{service_name}")
-#         tool_description = tool_info.get("description", f"Tool from {service_name} service")
-        
-#         class MCPTool(BaseTool):
-#             name = f"{service_name}_{tool_name}"
-#             description = tool_description
-            
-#             async def _arun(self, tool_input: str) -> str:
-#                 return await service_client.invoke_tool(tool_name, tool_input)
-            
-#             def _run(self, tool_input: str) -> str:
-#                 # 同步版本（如果需要）
-#                 return asyncio.run(service_client.invoke_tool(tool_name, tool_input))
-        
-#         return MCPTool()
-    
-#     async def close(self) -> None:
-#         """
-#         关闭所有服务连接和子进程
-#         """
-#         # 关闭子进程
-#         for service_name, process in self.processes.items():
-#             if process.poll() is None:  # 如果进程还在运行
-#                 process.terminate()
-#                 try:
-#                     process.wait(timeout=2)
-#                 except subprocess.TimeoutExpired:
-#                     process.kill()
-#                 print(f"Closed {service_name} subprocess")
+        async def list_tools():
+            async with self._use(server_name) as transport:
+                return transport, await transport.list_tools()
+
+        with tracing.span("mcp.discover", server=server_name) as span:
+            transport, tools = await asyncio.wait_for(list_tools(), timeout)
+            span.set_attribute("tools", len(tools))
+        self._catalog.put(server_name, tools, config.get("version"))
+        self._loaded.add(server_name)
+        self._unverified.discard(server_name)
+        if self._schema_cache is not None:
+            self._schema_cache.save(server_name, config, tools, transport.server_version)
+        return tools
+
+    async def _revalidate(self, server_name):
+        """重新向服务查询工具列表并刷新内存与磁盘缓存"""
+        self._unverified.discard(server_name)
+        try:
+            await self._discovery.do(server_name, lambda: self._fetch_tools(server_name))
+        except Exception as e:
+            logger.warning("Error revalidating tools of %s: %r", server_name, e)
+
+    async def revalidate_tools(self):
+        """立即核对所有来自磁盘缓存的工具目录（会启动对应的服务）"""
+        await asyncio.gather(*(self._revalidate(server_name) for server_name in list(self._unverified)))
+
+    def _spawn(self, coroutine):
+        """启动后台任务并保留引用，close 时统一取消"""
+        task = asyncio.ensure_future(coroutine)
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+        return task
+
+    def invalidate_tools(self, server_name=None):
+        """使工具目录失效，下次 get_tools 时重新发现"""
+        self._catalog.invalidate(server_name)
+
+    def _on_notification(self, server_name, message):
+        """处理服务端推送的通知"""
+        if message.get("method") == "notifications/tools/list_changed":
+            self._catalog.invalidate(server_name)
+
+    def _create_transport(self, server_name):
+        """根据配置中的 transport 字段创建传输层实例"""
+        config = self.tools[server_name]
+        transport = config.get("transport")
+        if transport == "stdio":
+            instance = StdioTransport(config)
+        elif transport == "streamable_http":
+            # httpx 只在配置了 HTTP 服务时才导入，只用 stdio 服务的进程不必加载
+            from .http_transport import StreamableHttpTransport
+            instance = StreamableHttpTransport(config)
+        else:
+            raise ValueError(f"Unsupported transport type '{transport}' for {server_name} service")
+        instance.on_notification = lambda message: self._on_notification(server_name, message)
+        return instance
+
+    async def _get_transport(self, server_name):
+        """获取服务对应的传输层，首次使用时启动并缓存，之后复用同一组常驻进程"""
+        if server_name not in self.tools:
+            raise KeyError(f"Unknown MCP server '{server_name}'")
+        transport = self._transports.get(server_name)
+        if transport is None:
+            transport = self._create_transport(server_name)
+            self._transports[server_name] = transport
+            self._last_used[server_name] = time.monotonic()
+            self._ensure_reaper()
+        await transport.start()
+        if server_name in self._unverified:
+            self._unverified.discard(server_name)
+            self._spawn(self._revalidate(server_name))
+        return transport
+
+    async def invoke(self, server_name, tool_name, arguments=None, on_progress=None, timeout=None):
+        """
+        调用指定服务上的工具，不阻塞事件循环，可被任意多个协程并发调用。
         
-#         # 关闭服务客户端
-#         for service_name, client in self.services.items():
-#             await client.close()
+        :param server_name: 配置中的服务名，例如 "math"
+        :param tool_name: 服务端工具名，例如 "calculate"
+        :param arguments: 工具参数字典
+        :param on_progress: 可选回调，接收服务端在调用过程中推送的进度/部分结果
+            （仅 streamable_http 传输支持）
+        :param timeout: 本次调用的截止时间（秒），默认使用 tool_timeouts / call_timeout 配置
+        :return: 工具返回结果
+        """
+        with tracing.span("mcp.invoke", server=server_name, tool=tool_name) as span:
+            ttl = self._result_ttl(server_name, tool_name)
+            if ttl is None:
+                return await self._call(server_name, tool_name, arguments, on_progress, timeout)
+
+            key = json.dumps([server_name, tool_name, arguments or {}], sort_keys=True, separators=(",", ":"),
+                             ensure_ascii=False, default=str)
+            cached = self._results.get(key)
+            if cached is not None:
+                span.set_attribute("cache", "hit")
+                # 缓存的结果由所有调用者共享，返回副本，调用方修改结果不会污染缓存
+                return copy.deepcopy(cached[0])
+            span.set_attribute("cache", "miss")
+
+            async def call():
+                result = await self._call(server_name, tool_name, arguments, on_progress, timeout)
+                # 包一层元组，使结果为 None 时也能与未命中区分
+                self._results.set(key, (result,), ttl)
+                return result
 
+            if on_progress is not None:
+                # 进度回调只属于发起它的调用者，不与其他调用合并
+                result = await call()
+            else:
+                # 只合并时限相同的调用：同一外层截止时间内的并发调用共享一次请求，时限不同的各自发起
+                result = await self._result_flight.do((key, timeout, deadlines.current()), call)
+            return copy.deepcopy(result)
 
-# # 不同传输类型的服务客户端实现
+    async def _call(self, server_name, tool_name, arguments, on_progress=None, timeout=None):
+        async def attempt(transport, remaining):
+            kwargs = {}
+            if on_progress is not None:
+                kwargs["on_progress"] = on_progress
+            if remaining is not None:
+                kwargs["timeout"] = remaining
+            return await transport.call_tool(tool_name, arguments, **kwargs)
 
-# class StdioServiceClient:
-#     """
-#     通过标准输入输出与MCP服务通信的客户端
-#     """
-    
-#     def __init__(self, config: Dict[str, Any]):
-#         command = config.get("command")
-#         args = config.get("args", [])
+        return await self._execute(server_name, tool_name, attempt, timeout)
+
+    async def _execute(self, server_name, tool_name, attempt, timeout=None):
+        """
+        带截止时间、重试与熔断地执行一次调用，并按服务记录调用结果与延迟。
         
-#         if not command:
-#             raise ValueError("Missing 'command' for stdio service")
+        :param attempt: 协程函数 attempt(transport, remaining)，remaining 为剩余秒数（无截止时间时为 None）
+        """
+        started = time.perf_counter()
+        outcome = "error"
+        try:
+            result = await self._execute_with_retries(server_name, tool_name, attempt, timeout)
+            outcome = "ok"
+            return result
+        except BaseException as e:
+            outcome = self._outcome(e)
+            raise
+        finally:
+            self._calls.inc(server=server_name, outcome=outcome)
+            self._latency.observe(time.perf_counter() - started, server=server_name)
+
+    @staticmethod
+    def _outcome(error):
+        """把调用异常归类为统计中的 outcome 标签"""
+        for error_type, outcome in (
+            (ServerOverloadedError, "rejected"),
+            (CircuitOpenError, "circuit_open"),
+            (MCPTimeoutError, "timeout"),
+            (MCPTransportError, "transport_error"),
+            (MCPToolError, "tool_error"),
+            (asyncio.CancelledError, "cancelled"),
+        ):
+            if isinstance(error, error_type):
+                return outcome
+        return "error"
+
+    async def _execute_with_retries(self, server_name, tool_name, attempt, timeout):
+        configured = self._call_timeout(server_name, tool_name)
+        if timeout is None:
+            timeout = configured
+        # 调用方通过 deadline.scope() 设置的截止时间（如整轮 Agent 的时限）同样生效
+        ambient = deadlines.remaining()
+        if ambient is not None:
+            timeout = ambient if timeout is None else min(timeout, ambient)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        # 时限比服务配置的 call_timeout 短时，超时是调用方的时间不够，不能说明服务不健康
+        caller_bound = timeout is not None and (configured is None or timeout < configured)
+        policy = self._retry_policy(server_name, tool_name)
+        breaker = self._circuit_breaker(server_name)
+
+        last_error = None
+        for number in itertools.count(1):
+            if breaker:
+                try:
+                    breaker.acquire()
+                except CircuitOpenError as e:
+                    # 重试途中被熔断（例如半开探测名额已被其他调用占用）：抛出真正导致失败的传输错误
+                    if last_error is None:
+                        raise
+                    raise last_error from e
+            try:
+                async with self._admit(server_name, deadline), self._use(server_name, deadline) as transport:
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        raise MCPTimeoutError(f"调用 {server_name}.{tool_name} 超过 {timeout:.2f}s")
+                    result = await attempt(transport, remaining)
+            except MCPTransportError as e:
+                # 进程退出、连接断开、用满 call_timeout 的超时：说明服务不健康，计入熔断；幂等工具退避后重试
+                if breaker:
+                    if caller_bound and isinstance(e, MCPTimeoutError):
+                        breaker.release()
+                    else:
+                        breaker.record_failure()
+                        if breaker.state == breaker.OPEN:
+                            raise  # 本次失败使服务熔断，不再重试
+                last_error = e
+                delay = policy.delay(number)
+                if number >= policy.attempts or (deadline is not None and time.monotonic() + delay >= deadline):
+                    raise
+                logger.info("Retrying %s.%s after %r (attempt %d/%d)", server_name, tool_name, e,
+                            number + 1, policy.attempts)
+                with tracing.span("mcp.retry_backoff", server=server_name, tool=tool_name, attempt=number + 1):
+                    await asyncio.sleep(delay)
+                continue
+            except MCPToolError:
+                # 服务正常返回了工具错误，服务本身是健康的
+                if breaker:
+                    breaker.record_success()
+                raise
+            except BaseException:
+                if breaker:
+                    breaker.release()
+                raise
+            if breaker:
+                breaker.record_success()
+            return result
+
+    def _call_timeout(self, server_name, tool_name):
+        config = self.tools.get(server_name, {})
+        return config.get("tool_timeouts", {}).get(tool_name, config.get("call_timeout", self.call_timeout))
+
+    def _retry_policy(self, server_name, tool_name):
+        """只有幂等工具使用重试配置，其余工具只调用一次"""
+        config = self.tools.get(server_name, {})
+        idempotent = tool_name in config.get("idempotent", ()) or bool(
+            config.get("cache", {}).get(tool_name, {}).get("pure"))
+        return RetryPolicy.from_config(config.get("retry", self.retry) if idempotent else None)
+
+    def _circuit_breaker(self, server_name):
+        if server_name not in self._breakers:
+            settings = self.tools.get(server_name, {}).get("circuit_breaker", self.circuit_breaker)
+            self._breakers[server_name] = settings and CircuitBreaker(server_name, **settings)
+        return self._breakers[server_name]
+
+    def breaker_state(self, server_name):
+        """服务熔断器的当前状态（"closed" / "open" / "half_open"），未启用熔断时返回 None"""
+        breaker = self._circuit_breaker(server_name)
+        return breaker.state if breaker else None
+
+    @contextlib.asynccontextmanager
+    async def _admit(self, server_name, deadline=None):
+        """按服务的 max_in_flight / max_queue / queue_timeout 配置获取调用名额，排队不超过 deadline"""
+        controller = self._admission_controller(server_name)
+        if not controller:
+            yield
+            return
+        async with controller.slot(deadline):
+            yield
+
+    def _admission_controller(self, server_name):
+        if server_name not in self.tools:
+            raise KeyError(f"Unknown MCP server '{server_name}'")
+        if server_name not in self._admission:
+            config = self.tools[server_name]
+            max_in_flight = config.get("max_in_flight", self.max_in_flight)
+            self._admission[server_name] = max_in_flight and AdmissionController(
+                server_name,
+                max_in_flight,
+                max_queue=config.get("max_queue", self.max_queue),
+                queue_timeout=config.get("queue_timeout", self.queue_timeout),
+            )
+        return self._admission[server_name]
+
+    def admission_info(self, server_name):
+        """
+        服务准入控制的统计信息。
         
-#         # 启动子进程
-#         self.process = subprocess.Popen(
-#             [command] + args,
-#             stdin=subprocess.PIPE,
-#             stdout=subprocess.PIPE,
-#             stderr=subprocess.PIPE,
-#             text=True
-#         )
-    
-#     async def get_tools(self) -> List[Dict[str, Any]]:
-#         """获取工具列表"""
-#         # 发送获取工具的请求
-#         self._send_message({"type": "get_tools"})
+        :return: 字典，包含 in_flight、queued、admitted、rejected、timed_out 和平均耗时 latency；
+            未启用准入控制时返回 None
+        """
+        controller = self._admission.get(server_name)
+        if not controller:
+            return None
+        return {
+            "in_flight": controller.in_flight,
+            "queued": controller.queued,
+            "admitted": controller.admitted,
+            "rejected": controller.rejected,
+            "timed_out": controller.timed_out,
+            "latency": controller.latency,
+        }
+
+    def stats(self):
+        """
+        按服务汇总的调用统计，用于设置容量与扩缩容阈值。
         
-#         # 读取响应
-#         response = await self._read_message()
-#         return response.get("tools", [])
-    
-#     async def invoke_tool(self, tool_name: str, tool_input: str) -> str:
-#         """调用工具"""
-#         # 发送调用工具的请求
-#         self._send_message({
-#             "type": "invoke_tool",
-#             "tool_name": tool_name,
-#             "tool_input": tool_input
-#         })
+        :return: {服务名: 字典}，包含 calls（调用数，命中结果缓存的调用不计入）、
+            outcomes（按 ok / tool_error / timeout / transport_error / rejected / circuit_open / cancelled 分类）、
+            errors 与 error_rate（已取消的调用不算错误）、in_flight 和 queued（当前在途与排队的调用数）、
+            breaker（熔断器状态）以及 latency（count、mean_ms、p50/p95/p99_ms 与累计分桶 buckets）
+        """
+        outcomes = {}
+        for (server_name, outcome), count in self._calls.values().items():
+            outcomes.setdefault(server_name, {})[outcome] = int(count)
+        stats = {}
+        for server_name in self.tools:
+            counts = outcomes.get(server_name, {})
+            calls = sum(counts.values())
+            errors = calls - counts.get("ok", 0) - counts.get("cancelled", 0)
+            controller = self._admission.get(server_name)
+            in_flight = self._active.get(server_name, 0)
+            queued = controller.queued if controller else 0
+            self._in_flight_gauge.set(in_flight, server=server_name)
+            self._queued_gauge.set(queued, server=server_name)
+            stats[server_name] = {
+                "calls": calls,
+                "outcomes": counts,
+                "errors": errors,
+                "error_rate": errors / calls if calls else 0.0,
+                "in_flight": in_flight,
+                "queued": queued,
+                "breaker": self._breakers[server_name].state if self._breakers.get(server_name) else None,
+                "latency": self._latency.snapshot(server=server_name),
+            }
+        return stats
+
+    def metrics_text(self):
+        """以 Prometheus 文本格式导出调用统计，可挂到应用自己的 /metrics 路由上"""
+        self.stats()  # 刷新在途与排队数
+        return self._metrics.render()
+
+    def _result_ttl(self, server_name, tool_name):
+        """工具结果的缓存秒数；未在服务配置的 cache 中声明的工具返回 None（不缓存）"""
+        policy = self.tools.get(server_name, {}).get("cache", {}).get(tool_name)
+        if not policy:
+            return None
+        if policy.get("pure"):
+            return policy.get("ttl", math.inf)
+        return policy.get("ttl")
+
+    def cache_info(self):
+        """
+        工具结果缓存的统计信息。
         
-#         # 读取响应
-#         response = await self._read_message()
-#         return response.get("result", "")
-    
-#     def _send_message(self, message: Dict[str, Any]) -> None:
-#         """发送JSON消息到服务"""
-#         if self.process.stdin:
-#             json.dump(message, self.process.stdin)
-#             self.process.stdin.write('\n')
-#             self.process.stdin.flush()
-    
-#     async def _read_message(self) -> Dict[str, Any]:
-#         """异步读取服务的JSON响应"""
-#         if self.process.stdout:
-#             # 注意：这不是真正的异步实现，仅作示例
-#             # 实际实现需要使用asyncio.subprocess或其他异步方式
-#             line = self.process.stdout.readline()
-#             return json.loads(line)
-#         return {}
-    
-#     async def close(self) -> None:
-#         """关闭连接"""
-#         # 由主客户端处理进程关闭
-
-
-# class HttpServiceClient:
-#     """
-#     通过HTTP与MCP服务通信的客户端
-#     """
-    
-#     def __init__(self, base_url: str):
-#         self.base_url = base_url
-#         self.client = httpx.AsyncClient()
-    
-#     async def get_tools(self) -> List[Dict[str, Any]]:
-#         """获取工具列表"""
-#         response = await self.client.get(f"{self.base_url}/tools")
-#         return response.json().get("tools", [])
-    
-#     async def invoke_tool(self, tool_name: str, tool_input: str) -> str:
-#         """调用工具"""
-#         response = await self.client.post(
-#             f"{self.base_url}/tools/{tool_name}",
-#             json={"input": tool_input}
-#         )
-#         return response.json().get("result", "")
-    
-#     async def close(self) -> None:
-#         """关闭连接"""
-#         await self.client.aclose()
-
-
-# class WebSocketServiceClient:
-#     """
-#     通过WebSocket与MCP服务通信的客户端
-#     """
-    
-#     def __init__(self, ws_url: str):
-#         self.ws_url = ws_url
-#         self.websocket = None
-    
-#     async def _ensure_connected(self) -> None:
-#         """确保WebSocket连接已建立"""
-#         if not self.websocket or self.websocket.closed:
-#             self.websocket = await websockets.connect(self.ws_url)
-    
-#     async def get_tools(self) -> List[Dict[str, Any]]:
-#         """获取工具列表"""
-#         await self._ensure_connected()
-#         await self.websocket.send(json.dumps({"type": "get_tools"}))
-#         response = await self.websocket.recv()
-#         return json.loads(response).get("tools", [])
-    
-#     async def invoke_tool(self, tool_name: str, tool_input: str) -> str:
-#         """调用工具"""
-#         await self._ensure_connected()
-#         await self.websocket.send(json.dumps({
-#             "type": "invoke_tool",
-#             "tool_name": tool_name,
-#             "tool_input": tool_input
-#         }))
-#         response = await self.websocket.recv()
-#         return json.loads(response).get("result", "")
-    
-#     async def close(self) -> None:
-#         """关闭连接"""
-#         if self.websocket and not self.websocket.closed:
-#             await self.websocket.close()
-
-# class StreamableHttpServiceClient:
-#     """
-#     通过流式HTTP与MCP服务通信的客户端（适用于天气服务）
-#     """
-    
-#     def __init__(self, config: Dict[str, Any]):
-#         self.base_url = config.get("url")
-#         if not self.base_url:
-#             raise ValueError("Missing 'url' for streamable_http service")
+        :return: 字典，包含 hits、misses、coalesced（被合并的并发调用数）、size 和 maxsize
+        """
+        return {
+            "hits": self._results.hits,
+            "misses": self._results.misses,
+            "coalesced": self._result_flight.coalesced,
+            "size": len(self._results),
+            "maxsize": self._results.maxsize,
+        }
+
+    def clear_cache(self):
+        """清空工具结果缓存"""
+        self._results.clear()
+
+    async def batch_invoke(self, server_name, tool_name, arguments_list, timeout=None):
+        """
+        批量调用同一工具，整批只占用一次请求往返，结果按输入顺序返回。
         
-#         # 确保URL格式正确
-#         if not self.base_url.startswith("http"):
-#             self.base_url = f"http://{self.base_url}"
+        :param server_name: 配置中的服务名，例如 "math"
+        :param tool_name: 服务端工具名，例如 "calculate"
+        :param arguments_list: 参数字典列表，例如 [{"expression": "1 + 2"}, ...]
+        :param timeout: 整批调用的截止时间（秒），默认使用 tool_timeouts / call_timeout 配置
+        :return: 结果列表，失败项以 MCPToolError 实例占位
+        """
+        async def attempt(transport, remaining):
+            if not hasattr(transport, "batch_call_tool"):
+                raise ValueError(f"Server '{server_name}' does not support batch invocation")
+            if remaining is None:
+                return await transport.batch_call_tool(tool_name, arguments_list)
+            return await transport.batch_call_tool(tool_name, arguments_list, timeout=remaining)
+
+        with tracing.span("mcp.batch_invoke", server=server_name, tool=tool_name, size=len(arguments_list)):
+            return await self._execute(server_name, tool_name, attempt, timeout)
+
+    @contextlib.asynccontextmanager
+    async def _use(self, server_name, deadline=None):
+        """
+        在一次调用期间占用服务：记录在途数与最近使用时间，防止被空闲回收。
         
-#         # 服务端点
-#         self.sse_url = f"{self.base_url}/sse"
-#         self.messages_url = f"{self.base_url}/messages/"
-#         self.tools_url = f"{self.base_url}/tools"
-    
-#     async def get_tools(self) -> List[Dict[str, Any]]:
-#         """获取工具列表"""
-#         try:
-#             async with httpx.AsyncClient() as client:
-#                 response = await client.get(self.tools_url)
-#                 response.raise_for_status()
-#                 return response.json().get("tools", [])
-#         except Exception as e:
-#             print(f"Error fetching tools: {e}")
-#             # 回退方案：手动定义工具列表
-#             return [
-#                 {
-#                     "name": "get_forecast",
-#                     "description": "Get weather forecast for a location.",
-#                     "parameters": {
-#                         "type": "object",
-#                         "properties": {
-#                             "latitude": {"type": "number"},
-#                             "longitude": {"type": "number"}
-#                         },
-#                         "required": ["latitude", "longitude"]
-#                     }
-#                 },
-#                 {
-#                     "name": "get_alerts",
-#                     "description": "Get weather alerts for a US state.",
-#                     "parameters": {
-#                         "type": "object",
-#                         "properties": {
-#                             "state": {"type": "string"}
-#                         },
-#                         "required": ["state"]
-#                     }
-#                 }
-#             ]
-    
-#     async def invoke_tool(self, tool_name: str, tool_input: str) -> str:
-#         """调用工具（通过SSE协议）"""
-#         try:
-#             # 解析工具输入为JSON
-#             params = json.loads(tool_input)
-            
-#             # 发送工具调用请求
-#             async with httpx.AsyncClient() as client:
-#                 response = await client.post(
-#                     self.messages_url,
-#                     json={
-#                         "type": "function_call",
-#                         "name": tool_name,
-#                         "parameters": params
-#                     }
-#                 )
-#                 response.raise_for_status()
-            
-#             # 建立SSE连接接收结果
-#             sse = SSEClient(self.sse_url)
-            
-#             # 等待工具执行结果
-#             for event in sse:
-#                 if event.event == "function_call_result":
-#                     data = json.loads(event.data)
-#                     if data.get("name") == tool_name:
-#                         return data.get("parameters", {}).get("result", "")
-            
-#             return "No result received from service"
-            
-#         except Exception as e:
-#             return f"Error invoking tool: {str(e)}"
\ No newline at end of file
+        :param deadline: 调用的截止时刻（time.monotonic()），服务启动也不能超过它
+        """
+        self._active[server_name] = self._active.get(server_name, 0) + 1
+        try:
+            if deadline is None:
+                transport = await self._get_transport(server_name)
+            else:
+                try:
+                    transport = await asyncio.wait_for(self._get_transport(server_name),
+                                                       max(deadline - time.monotonic(), 0))
+                except asyncio.TimeoutError:
+                    raise MCPTimeoutError(f"服务 {server_name} 未能在截止时间内启动") from None
+            yield transport
+        finally:
+            self._active[server_name] -= 1
+            self._last_used[server_name] = time.monotonic()
+
+    def _server_idle_timeout(self, server_name):
+        return self.tools[server_name].get("idle_timeout", self.idle_timeout)
+
+    def _ensure_reaper(self):
+        """存在已启动的服务且配置了空闲超时时，启动后台回收任务"""
+        if self._reaper is not None and not self._reaper.done():
+            return
+        timeouts = [t for t in (self._server_idle_timeout(name) for name in self.tools) if t]
+        if timeouts:
+            self._reaper = asyncio.ensure_future(self._reap_idle(min(timeouts) / 2))
+
+    async def _reap_idle(self, interval):
+        """周期性关闭空闲超时且没有在途调用的服务；没有已启动的服务时退出"""
+        while self._transports:
+            await asyncio.sleep(interval)
+            now = time.monotonic()
+            for server_name, transport in list(self._transports.items()):
+                timeout = self._server_idle_timeout(server_name)
+                if not timeout or self._active.get(server_name):
+                    continue
+                if now - self._last_used.get(server_name, now) < timeout:
+                    continue
+                if self._transports.get(server_name) is transport:
+                    del self._transports[server_name]
+                logger.debug("Closing idle MCP server %s", server_name)
+                await transport.close()
+
+    async def close(self):
+        """关闭所有已启动的服务连接和子进程；之后再次调用会按需重新启动"""
+        tasks = list(self._background)
+        if self._reaper is not None:
+            tasks.append(self._reaper)
+            self._reaper = None
+        for task in tasks:
+            task.cancel()
+        transports, self._transports = self._transports, {}
+        await asyncio.gather(*(transport.close() for transport in transports.values()))
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
@@ -1,3 +1,6 @@
 from .MCPClient import MCPClient
+from .errors import (CircuitOpenError, MCPError, MCPTimeoutError, MCPToolError, MCPTransportError,
+                     ServerOverloadedError)
 
-__all__ = ["MCPClient"]
\ No newline at end of file
+__all__ = ["CircuitOpenError", "MCPClient", "MCPError", "MCPTimeoutError", "MCPToolError",
+           "MCPTransportError", "ServerOverloadedError"]
\ No newline at end of file
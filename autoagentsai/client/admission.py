@@ -0,0 +1,118 @@
+import asyncio
+import collections
+import contextlib
+import math
+import time
+from typing import Deque, Optional
+
+from autoagentsai.utils import tracing
+
+from .errors import ServerOverloadedError
+
+
+class AdmissionController:
+    """
+    单个服务的准入控制：限制同时在途的调用数，超出的调用进入有界队列排队。
+
+    - 在途调用达到 max_in_flight 时新调用排队，按先来先服务放行；
+    - 队列已满（max_queue）时立即拒绝，不再增加排队时间；
+    - 每个调用最多排队 queue_timeout 秒（或调用方给出的截止时间）；
+      根据近期调用耗时估算的排队时间已超过可等待时间时直接拒绝，不做注定超时的等待。
+    被拒绝的调用抛出 ServerOverloadedError。
+    """
+
+    # 调用耗时指数滑动平均的权重
+    _ALPHA = 0.2
+
+    def __init__(self, name: str, max_in_flight: int, max_queue: Optional[int] = None,
+                 queue_timeout: Optional[float] = None):
+        if max_in_flight < 1:
+            raise ValueError("'max_in_flight' must be >= 1")
+        if max_queue is not None and max_queue < 0:
+            raise ValueError("'max_queue' must be >= 0")
+        self.name = name
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.in_flight = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+        # 调用耗时的滑动平均（秒），尚无样本时为 None
+        self.latency: Optional[float] = None
+        self._waiters: Deque[asyncio.Future] = collections.deque()
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiters)
+
+    def estimated_wait(self) -> Optional[float]:
+        """按当前队列长度和平均耗时估算新调用的排队时间"""
+        if self.latency is None:
+            return None
+        return math.ceil((self.queued + 1) / self.max_in_flight) * self.latency
+
+    @contextlib.asynccontextmanager
+    async def slot(self, deadline: Optional[float] = None):
+        """
+        获取一个在途名额，退出时释放并交给队首的等待者。
+
+        :param deadline: 调用方的截止时间（time.monotonic() 时间戳），与 queue_timeout 取较早者
+        """
+        with tracing.span("mcp.queue", server=self.name, in_flight=self.in_flight, queued=self.queued):
+            await self._acquire(deadline)
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            elapsed = time.monotonic() - started
+            self.latency = elapsed if self.latency is None else (
+                self._ALPHA * elapsed + (1 - self._ALPHA) * self.latency)
+            self._release()
+
+    async def _acquire(self, deadline: Optional[float]) -> None:
+        if self.in_flight < self.max_in_flight and not self._waiters:
+            self.in_flight += 1
+            self.admitted += 1
+            return
+
+        if self.max_queue is not None and self.queued >= self.max_queue:
+            self.rejected += 1
+            raise ServerOverloadedError(f"服务 {self.name} 过载：排队已满（{self.queued}）")
+
+        timeout = self.queue_timeout
+        if deadline is not None:
+            remaining = deadline - time.monotonic()
+            timeout = remaining if timeout is None else min(timeout, remaining)
+        if timeout is not None:
+            estimate = self.estimated_wait()
+            if timeout <= 0 or (estimate is not None and estimate > timeout):
+                self.rejected += 1
+                raise ServerOverloadedError(
+                    f"服务 {self.name} 过载：预计排队 {estimate or 0:.2f}s，超过可等待的 {max(timeout, 0):.2f}s")
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await asyncio.wait_for(waiter, timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if waiter.done() and not waiter.cancelled():
+                # 名额已经移交给本调用，但调用方已放弃：把名额继续交给下一个
+                self._release()
+            else:
+                with contextlib.suppress(ValueError):
+                    self._waiters.remove(waiter)
+            if isinstance(e, asyncio.TimeoutError):
+                self.timed_out += 1
+                raise ServerOverloadedError(f"服务 {self.name} 过载：排队超过 {timeout:.2f}s") from None
+            raise
+        self.admitted += 1
+
+    def _release(self) -> None:
+        # 名额直接移交给队首仍在等待的调用，in_flight 不变
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.in_flight -= 1
@@ -0,0 +1,154 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import time
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_schema(parameters: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    把服务端返回的参数描述统一为 JSON Schema 对象。
+
+    math_server 只返回 {参数名: 描述}，HTTP 服务返回完整的 object schema。
+    """
+    parameters = parameters or {}
+    if parameters.get("type") == "object":
+        return parameters
+    return {"type": "object", "properties": parameters, "required": list(parameters)}
+
+
+class MCPTool:
+    """
+    从 MCP 服务发现的工具。
+
+    name 为暴露给 Agent 的名称（跨服务重名时带服务名前缀），tool_name 为服务端的原始名称，
+    调用经 MCPClient 转发到对应服务。timeout 为每次调用的截止时间（秒），None 时使用客户端配置。
+    """
+
+    def __init__(self, client, server: str, tool_name: str, description: str = "",
+                 parameters: Optional[Dict[str, Any]] = None, name: Optional[str] = None,
+                 timeout: Optional[float] = None):
+        self.client = client
+        self.server = server
+        self.tool_name = tool_name
+        self.name = name or tool_name
+        self.description = description
+        self.parameters = normalize_schema(parameters)
+        self.timeout = timeout
+
+    def __repr__(self) -> str:
+        return f"MCPTool(server={self.server!r}, name={self.name!r})"
+
+    def _arguments(self, args: tuple, kwargs: Dict[str, Any]) -> Dict[str, Any]:
+        """把 Agent 传入的参数整理为参数字典：支持关键字参数、字典、JSON 字符串或单参数工具的裸值"""
+        if kwargs:
+            return kwargs
+        if not args:
+            return {}
+        value = args[0]
+        if isinstance(value, str):
+            try:
+                parsed = json.loads(value)
+            except ValueError:
+                parsed = None
+            if isinstance(parsed, dict):
+                return parsed
+        if isinstance(value, dict):
+            return value
+        properties = list(self.parameters.get("properties", {}))
+        if len(properties) == 1:
+            return {properties[0]: value}
+        raise ValueError(f"Cannot map positional input to parameters of tool '{self.name}'")
+
+    async def arun(self, *args, **kwargs) -> Any:
+        """异步调用工具；外层 deadline.scope() 设置的截止时间同样生效"""
+        return await self.client.invoke(self.server, self.tool_name, self._arguments(args, kwargs),
+                                        timeout=self.timeout)
+
+    def run(self, *args, **kwargs) -> Any:
+        """同步调用工具，仅可在没有运行中事件循环的线程里使用"""
+        return asyncio.run(self.arun(*args, **kwargs))
+
+
+class ToolCatalog:
+    """
+    按服务缓存已发现的工具列表。
+
+    条目在以下情况失效：超过 ttl 秒、配置中声明的服务版本号变化、或被显式 invalidate
+    （例如收到 tools/list_changed 通知）。ttl 为 None 表示不过期。
+    """
+
+    def __init__(self, ttl: Optional[float] = None):
+        self.ttl = ttl
+        self._entries: Dict[str, Dict[str, Any]] = {}
+
+    def get(self, server: str, version: Optional[str] = None) -> Optional[List[Dict[str, Any]]]:
+        entry = self._entries.get(server)
+        if entry is None:
+            return None
+        if self.ttl is not None and time.monotonic() - entry["fetched_at"] > self.ttl:
+            return None
+        if version is not None and entry["version"] != version:
+            return None
+        return entry["tools"]
+
+    def put(self, server: str, tools: List[Dict[str, Any]], version: Optional[str] = None) -> None:
+        self._entries[server] = {
+            "tools": tools,
+            "version": version,
+            "fetched_at": time.monotonic(),
+        }
+
+    def invalidate(self, server: Optional[str] = None) -> None:
+        if server is None:
+            self._entries.clear()
+        else:
+            self._entries.pop(server, None)
+
+
+class ToolSchemaCache:
+    """
+    工具目录的磁盘缓存，用于缩短短生命周期进程的冷启动。
+
+    每个服务一个 JSON 文件，文件名包含服务配置的哈希（配置或其中的 version 变化即视为新条目），
+    文件内同时记录服务端自报的版本号，便于排查缓存来自哪个版本的服务；
+    条目在后台重新验证时整体覆盖，不按该版本号判断是否失效。
+    """
+
+    def __init__(self, directory: str):
+        self.directory = os.path.expanduser(directory)
+
+    def path(self, server: str, config: Dict[str, Any]) -> str:
+        digest = hashlib.sha256(
+            json.dumps([server, config], sort_keys=True, default=str).encode()
+        ).hexdigest()[:16]
+        return os.path.join(self.directory, f"tools-{digest}.json")
+
+    def load(self, server: str, config: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """读取缓存条目，不存在或损坏时返回 None"""
+        try:
+            with open(self.path(server, config), encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if not isinstance(entry, dict) or not isinstance(entry.get("tools"), list):
+            return None
+        return entry
+
+    def save(self, server: str, config: Dict[str, Any], tools: List[Dict[str, Any]],
+             server_version: Optional[str] = None) -> None:
+        """原子地写入缓存条目（先写临时文件再替换），写入失败只记录日志"""
+        entry = {"server": server, "server_version": server_version, "tools": tools, "saved_at": time.time()}
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(entry, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path(server, config))
+        except OSError as e:
+            logger.warning("Failed to write tool cache for %s: %s", server, e)
@@ -0,0 +1,93 @@
+import asyncio
+import json
+import struct
+from typing import Any, Dict, Optional
+
+try:
+    import orjson
+except ImportError:  # 未安装 orjson 时使用标准库 json
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # 未安装 msgpack 时只使用 JSON 行格式
+    msgpack = None
+
+# MessagePack 帧头：4 字节大端无符号整数，表示帧体长度
+_FRAME_HEADER = struct.Struct(">I")
+
+
+def dumps(obj: Any) -> bytes:
+    """序列化为 JSON 字节串；orjson 可用时使用 orjson，遇到它不支持的类型时退回标准库"""
+    if orjson is not None:
+        try:
+            return orjson.dumps(obj)
+        except TypeError:
+            pass
+    return json.dumps(obj).encode()
+
+
+def loads(data: Any) -> Any:
+    return orjson.loads(data) if orjson is not None else json.loads(data)
+
+
+class JsonLinesCodec:
+    """默认线路格式：请求为 "ACTION <json>\\n"（无载荷时为 "ACTION\\n"），响应为一行 JSON"""
+
+    name = "json"
+
+    def encode_request(self, action: str, message: Optional[Dict[str, Any]]) -> bytes:
+        if message is None:
+            return action.encode() + b"\n"
+        return action.encode() + b" " + dumps(message) + b"\n"
+
+    async def read(self, stream: asyncio.StreamReader) -> Optional[bytes]:
+        """读取一条消息，流结束时返回 None"""
+        line = await stream.readline()
+        return line or None
+
+    def decode(self, data: bytes) -> Any:
+        return loads(data)
+
+
+class MsgpackCodec:
+    """长度前缀的 MessagePack 帧：请求帧体为 [action, payload]，响应帧体为响应字典"""
+
+    name = "msgpack"
+
+    def encode_request(self, action: str, message: Dict[str, Any]) -> bytes:
+        body = msgpack.packb([action, message])
+        return _FRAME_HEADER.pack(len(body)) + body
+
+    async def read(self, stream: asyncio.StreamReader) -> Optional[bytes]:
+        try:
+            header = await stream.readexactly(_FRAME_HEADER.size)
+            return await stream.readexactly(_FRAME_HEADER.unpack(header)[0])
+        except asyncio.IncompleteReadError:
+            return None
+
+    def decode(self, data: bytes) -> Any:
+        return msgpack.unpackb(data)
+
+
+JSON_LINES = JsonLinesCodec()
+CODECS = {JSON_LINES.name: JSON_LINES}
+if msgpack is not None:
+    CODECS[MsgpackCodec.name] = MsgpackCodec()
+
+
+def offered_formats(wire_format: str) -> Optional[list]:
+    """
+    根据配置的 wire_format 计算握手时向服务端声明的格式列表（按优先级）。
+
+    "auto" 在安装了 msgpack 时优先 MessagePack；"json" 不协商格式，返回 None。
+    """
+    if wire_format == "json":
+        return None
+    if wire_format not in ("auto", "msgpack"):
+        raise ValueError(f"Unsupported wire_format '{wire_format}', expected 'auto', 'json' or 'msgpack'")
+    if msgpack is None:
+        if wire_format == "msgpack":
+            raise ValueError("wire_format 'msgpack' requires the msgpack package")
+        return None
+    return ["msgpack", "json"]
@@ -0,0 +1,22 @@
+class MCPError(Exception):
+    """MCP 客户端异常基类"""
+
+
+class MCPTransportError(MCPError):
+    """传输层异常：子进程退出、管道断开、响应无法解析等"""
+
+
+class MCPToolError(MCPError):
+    """服务端返回的工具执行错误（响应中包含 error 字段）"""
+
+
+class ServerOverloadedError(MCPError):
+    """服务过载：在途调用已达上限且排队已满，或预计排队时间超过调用方可等待的时间"""
+
+
+class MCPTimeoutError(MCPTransportError):
+    """调用超过截止时间仍未返回（已通知服务端取消该请求）"""
+
+
+class CircuitOpenError(MCPError):
+    """服务处于熔断状态：近期连续失败，调用被直接拒绝，恢复探测通过前不再发送请求"""
@@ -0,0 +1,328 @@
+import asyncio
+import contextlib
+import itertools
+import json
+import logging
+import time
+from typing import Any, Callable, Dict, List, Optional
+from urllib.parse import urljoin
+
+import httpx
+
+from autoagentsai.utils import tracing
+
+from .errors import MCPTimeoutError, MCPToolError, MCPTransportError
+
+logger = logging.getLogger(__name__)
+
+PROTOCOL_VERSION = "2024-11-05"
+CLIENT_INFO = {"name": "autoagentsai", "version": "0.1.0"}
+
+
+class StreamableHttpTransport:
+    """
+    HTTP/SSE 传输层：每个服务维持一个常驻 MCP 会话。
+
+    start() 时打开一条 /sse 长连接并完成 initialize 握手，之后所有请求
+    通过连接池中的连接 POST 到服务端下发的 /messages/ 端点，响应和进度
+    通知从同一条 SSE 流返回，由后台监听任务按 JSON-RPC id 分发给等待者。
+    SSE 流断开时在途请求立即失败，下一次请求自动重建会话。
+    """
+
+    def __init__(self, config: Dict[str, Any]):
+        base_url = config.get("url")
+        if not base_url:
+            raise ValueError("Missing 'url' for streamable_http service")
+        # 确保URL格式正确
+        if not base_url.startswith("http"):
+            base_url = f"http://{base_url}"
+
+        self.base_url = base_url.rstrip("/")
+        self.sse_url = f"{self.base_url}{config.get('sse_path', '/sse')}"
+        self.timeout = config.get("timeout", 30.0)
+        self.limits = httpx.Limits(
+            max_connections=config.get("max_connections", 10),
+            max_keepalive_connections=config.get("max_keepalive", 10),
+        )
+        self.server_version: Optional[str] = None
+        self.on_notification: Optional[Callable[[Dict[str, Any]], None]] = None
+        self._client: Optional[httpx.AsyncClient] = None
+        self._ids = itertools.count(1)
+        self._pending: Dict[int, asyncio.Future] = {}
+        # progressToken -> 回调，接收调用过程中推送的 notifications/progress
+        self._progress: Dict[int, Callable[[Dict[str, Any]], None]] = {}
+        self._messages_url: Optional[str] = None
+        self._listener: Optional[asyncio.Task] = None
+        self._start_lock: Optional[asyncio.Lock] = None
+
+    @property
+    def connected(self) -> bool:
+        return self._messages_url is not None and self._listener is not None and not self._listener.done()
+
+    async def start(self) -> None:
+        """建立 SSE 会话并完成握手（会话存活时直接返回）"""
+        if self._start_lock is None:
+            self._start_lock = asyncio.Lock()
+        async with self._start_lock:
+            if self.connected:
+                return
+            await self._stop_listener()
+            if self._client is None:
+                # SSE 流长期占用一条连接且没有读超时，其余连接供 POST 复用
+                self._client = httpx.AsyncClient(timeout=self.timeout, limits=self.limits)
+            endpoint = asyncio.get_running_loop().create_future()
+            # 每个会话使用独立的在途表，旧监听任务收尾时不会误伤新请求
+            self._pending = {}
+            self._listener = asyncio.ensure_future(self._listen(endpoint, self._pending))
+            # 整个握手共用 timeout 秒：无响应的服务不能无限期占住 _start_lock，阻塞所有等待启动的调用
+            deadline = time.monotonic() + self.timeout
+            try:
+                try:
+                    self._messages_url = await asyncio.wait_for(asyncio.shield(endpoint), self.timeout)
+                except asyncio.TimeoutError:
+                    raise MCPTimeoutError(f"{self.sse_url} 超过 {self.timeout:.2f}s 未下发消息端点") from None
+                result = await self._request("initialize", {
+                    "protocolVersion": PROTOCOL_VERSION,
+                    "capabilities": {},
+                    "clientInfo": CLIENT_INFO,
+                }, timeout=max(deadline - time.monotonic(), 0))
+                await self._post({"jsonrpc": "2.0", "method": "notifications/initialized"})
+            except BaseException:
+                await self._stop_listener()
+                raise
+            self.server_version = (result.get("serverInfo") or {}).get("version")
+
+    async def _listen(self, endpoint: asyncio.Future, pending: Dict[int, asyncio.Future]) -> None:
+        """后台监听任务：解析 SSE 事件流并分发响应与通知"""
+        error: Optional[Exception] = None
+        try:
+            async with self._client.stream(
+                "GET",
+                self.sse_url,
+                headers={"Accept": "text/event-stream"},
+                timeout=httpx.Timeout(self.timeout, read=None),
+            ) as response:
+                response.raise_for_status()
+                event, data = "message", []
+                async for line in response.aiter_lines():
+                    if not line:
+                        # 空行结束一个事件
+                        if data:
+                            self._handle_event(event, "\n".join(data), endpoint, pending)
+                        event, data = "message", []
+                        continue
+                    if line.startswith(":"):
+                        continue
+                    field, _, value = line.partition(":")
+                    if value.startswith(" "):
+                        value = value[1:]
+                    if field == "event":
+                        event = value
+                    elif field == "data":
+                        data.append(value)
+        except httpx.HTTPError as e:
+            error = MCPTransportError(f"SSE 连接失败 {self.sse_url}: {e}")
+        finally:
+            error = error or MCPTransportError("SSE 连接已断开")
+            if not endpoint.done():
+                endpoint.set_exception(error)
+            if pending is self._pending:
+                self._messages_url = None
+            self._fail_pending(pending, error)
+
+    def _handle_event(self, event: str, data: str, endpoint: asyncio.Future,
+                      pending: Dict[int, asyncio.Future]) -> None:
+        if event == "endpoint":
+            if not endpoint.done():
+                endpoint.set_result(urljoin(f"{self.base_url}/", data))
+            return
+        if event != "message":
+            return
+        started = time.perf_counter() if tracing.is_enabled() else None
+        try:
+            message = json.loads(data)
+        except ValueError:
+            logger.warning("[%s] 无法解析服务消息: %r", self.base_url, data[:200])
+            return
+        if started is not None:
+            # 监听任务不属于任何调用的上下文，只计入耗时统计
+            tracing.record("http.decode", time.perf_counter() - started)
+
+        method = message.get("method")
+        if method is None:
+            future = pending.pop(message.get("id"), None)
+            if future is None:
+                # 调用方超时或取消后服务端仍可能写回结果
+                logger.debug("[%s] 收到无人等待的响应: %r", self.base_url, message)
+            elif not future.done():
+                future.set_result(message)
+        elif "id" in message:
+            # 服务端发起的请求：只应答 ping，其余一律回复“方法不存在”
+            if method == "ping":
+                reply = {"jsonrpc": "2.0", "id": message["id"], "result": {}}
+            else:
+                reply = {"jsonrpc": "2.0", "id": message["id"],
+                         "error": {"code": -32601, "message": f"Method not found: {method}"}}
+            asyncio.ensure_future(self._post_quietly(reply))
+        elif method == "notifications/progress":
+            params = message.get("params") or {}
+            callback = self._progress.get(params.get("progressToken"))
+            if callback is not None:
+                callback(params)
+        elif self.on_notification is not None:
+            self.on_notification(message)
+
+    @staticmethod
+    def _fail_pending(pending: Dict[int, asyncio.Future], exc: Exception) -> None:
+        futures = list(pending.values())
+        pending.clear()
+        for future in futures:
+            if not future.done():
+                future.set_exception(exc)
+
+    async def _post(self, message: Dict[str, Any]) -> None:
+        try:
+            response = await self._client.post(self._messages_url, json=message)
+            response.raise_for_status()
+        except httpx.HTTPStatusError as e:
+            if e.response.status_code == 404:
+                # 服务端已丢弃该会话，下次请求时重建
+                self._messages_url = None
+            raise MCPTransportError(f"发送请求失败 {self._messages_url}: {e}") from e
+        except httpx.HTTPError as e:
+            raise MCPTransportError(f"发送请求失败 {self._messages_url}: {e}") from e
+
+    async def _post_quietly(self, message: Dict[str, Any]) -> None:
+        if self._messages_url is None:
+            return  # 会话已在发送前关闭（如握手超时），通知随会话一起作废
+        try:
+            await self._post(message)
+        except MCPTransportError as e:
+            logger.debug("[%s] %s", self.base_url, e)
+
+    async def _request(self, method: str, params: Optional[Dict[str, Any]] = None,
+                       on_progress: Optional[Callable[[Dict[str, Any]], None]] = None,
+                       timeout: Optional[float] = None) -> Dict[str, Any]:
+        """
+        发送一条 JSON-RPC 请求并等待 id 匹配的响应。
+
+        :param method: JSON-RPC 方法名，如 "tools/call"
+        :param params: 请求参数
+        :param on_progress: 进度回调，设置后以请求 id 作为 progressToken
+        :param timeout: 等待响应的最长秒数，超时或调用方被取消时发送 notifications/cancelled
+        :return: 响应中的 result 字段
+        """
+        with tracing.span("http.request", url=self.base_url, method=method):
+            request_id = next(self._ids)
+            params = dict(params or {})
+            # 追踪开启时把 traceparent 放进 MCP 请求的 _meta，服务端据此关联 span
+            meta = tracing.inject({})
+            if on_progress is not None:
+                meta["progressToken"] = request_id
+                self._progress[request_id] = on_progress
+            if meta:
+                params["_meta"] = meta
+            future = asyncio.get_running_loop().create_future()
+            pending = self._pending
+            pending[request_id] = future
+            try:
+                with tracing.span("http.post"):
+                    await self._post({"jsonrpc": "2.0", "id": request_id, "method": method, "params": params})
+                try:
+                    with tracing.span("http.wait"):
+                        response = await asyncio.wait_for(asyncio.shield(future), timeout)
+                except asyncio.TimeoutError:
+                    self._cancel(request_id, "timeout")
+                    raise MCPTimeoutError(f"{method} 请求超过 {timeout:.2f}s 未返回") from None
+                except asyncio.CancelledError:
+                    self._cancel(request_id, "cancelled")
+                    raise
+            finally:
+                pending.pop(request_id, None)
+                self._progress.pop(request_id, None)
+        if "error" in response:
+            error = response["error"]
+            raise MCPToolError(error.get("message", str(error)) if isinstance(error, dict) else str(error))
+        return response.get("result") or {}
+
+    def _cancel(self, request_id: int, reason: str) -> None:
+        """通知服务端取消仍在执行的请求（尽力而为，不等待结果）"""
+        if self.connected:
+            asyncio.ensure_future(self._post_quietly({
+                "jsonrpc": "2.0",
+                "method": "notifications/cancelled",
+                "params": {"requestId": request_id, "reason": reason},
+            }))
+
+    async def list_tools(self) -> List[Dict[str, Any]]:
+        """通过 tools/list 获取服务端工具列表（自动翻页）"""
+        await self.start()
+        tools: List[Dict[str, Any]] = []
+        cursor = None
+        while True:
+            result = await self._request("tools/list", {"cursor": cursor} if cursor else None)
+            tools.extend(
+                {
+                    "name": tool["name"],
+                    "description": tool.get("description") or "",
+                    "parameters": tool.get("inputSchema"),
+                }
+                for tool in result.get("tools", [])
+            )
+            cursor = result.get("nextCursor")
+            if not cursor:
+                return tools
+
+    async def call_tool(self, tool_name: str, arguments: Optional[Dict[str, Any]] = None,
+                        on_progress: Optional[Callable[[Dict[str, Any]], None]] = None,
+                        timeout: Optional[float] = None) -> Any:
+        """
+        通过 tools/call 调用工具，返回文本内容。
+
+        :param on_progress: 可选回调，逐条接收服务端推送的进度通知参数
+            （progress / total / message），可用于流式展示部分结果
+        :param timeout: 调用的剩余时间（秒），超时后服务端的处理任务会被取消
+        """
+        await self.start()
+        result = await self._request(
+            "tools/call", {"name": tool_name, "arguments": arguments or {}},
+            on_progress=on_progress, timeout=timeout,
+        )
+        text = "\n".join(
+            item.get("text", "") for item in result.get("content", []) if item.get("type") == "text"
+        )
+        if result.get("isError"):
+            raise MCPToolError(text or f"工具 {tool_name} 执行失败")
+        return text
+
+    async def batch_call_tool(self, tool_name: str, arguments_list: List[Dict[str, Any]],
+                              timeout: Optional[float] = None) -> List[Any]:
+        """
+        批量调用工具：在同一会话上并发发送 tools/call，结果按输入顺序返回。
+
+        单项失败不影响其他项，失败项以 MCPToolError 实例占位；传输层失败使整批失败。
+        """
+        await self.start()
+
+        async def call(arguments: Dict[str, Any]) -> Any:
+            try:
+                return await self.call_tool(tool_name, arguments, timeout=timeout)
+            except MCPToolError as e:
+                return e
+
+        return list(await asyncio.gather(*(call(arguments) for arguments in arguments_list)))
+
+    async def _stop_listener(self) -> None:
+        listener, self._listener = self._listener, None
+        self._messages_url = None
+        if listener is not None and not listener.done():
+            listener.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await listener
+
+    async def close(self) -> None:
+        await self._stop_listener()
+        self._fail_pending(self._pending, MCPTransportError("会话已关闭"))
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
@@ -0,0 +1,95 @@
+import random
+import time
+from typing import Any, Dict, Optional
+
+from .errors import CircuitOpenError
+
+
+class RetryPolicy:
+    """
+    重试策略：指数退避 + 全抖动（full jitter）。
+
+    第 n 次失败后等待 [0, min(max_delay, base_delay * 2^(n-1))] 内的随机时间，
+    避免大量调用方在服务恢复的同一时刻集中重试。attempts 包含首次调用。
+    """
+
+    def __init__(self, attempts: int = 3, base_delay: float = 0.1, max_delay: float = 2.0):
+        if attempts < 1:
+            raise ValueError("'attempts' must be >= 1")
+        self.attempts = attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    @classmethod
+    def from_config(cls, config: Optional[Dict[str, Any]]) -> "RetryPolicy":
+        return cls(**(config or {"attempts": 1}))
+
+    def delay(self, attempt: int) -> float:
+        """第 attempt 次调用失败后、下一次重试前的等待秒数"""
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+
+
+class CircuitBreaker:
+    """
+    单个服务的熔断器。
+
+    - closed：正常放行，连续失败达到 failure_threshold 次后打开；
+    - open：直接抛出 CircuitOpenError，经过 recovery_timeout 秒后进入半开；
+    - half_open：最多放行 half_open_max_calls 个探测调用，成功则关闭，失败则重新打开。
+    只有传输层失败（进程退出、连接断开、超时）计为失败；服务正常返回的工具错误说明服务健康。
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name: str, failure_threshold: int = 5, recovery_timeout: float = 30.0,
+                 half_open_max_calls: int = 1):
+        if failure_threshold < 1:
+            raise ValueError("'failure_threshold' must be >= 1")
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.half_open_max_calls = half_open_max_calls
+        self.failures = 0
+        self.opened = 0
+        self._state = self.CLOSED
+        self._opened_at = 0.0
+        self._probes = 0
+
+    @property
+    def state(self) -> str:
+        if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.recovery_timeout:
+            self._state = self.HALF_OPEN
+            self._probes = 0
+        return self._state
+
+    def acquire(self) -> None:
+        """调用前检查：熔断中或半开探测名额已满时抛出 CircuitOpenError"""
+        state = self.state
+        if state == self.OPEN:
+            remaining = self.recovery_timeout - (time.monotonic() - self._opened_at)
+            raise CircuitOpenError(f"服务 {self.name} 熔断中，{remaining:.1f}s 后重新探测")
+        if state == self.HALF_OPEN:
+            if self._probes >= self.half_open_max_calls:
+                raise CircuitOpenError(f"服务 {self.name} 正在恢复探测")
+            self._probes += 1
+
+    def record_success(self) -> None:
+        self.failures = 0
+        if self._state == self.HALF_OPEN:
+            self._state = self.CLOSED
+            self._probes = 0
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self._state == self.HALF_OPEN or (self._state == self.CLOSED and self.failures >= self.failure_threshold):
+            self._state = self.OPEN
+            self._opened_at = time.monotonic()
+            self._probes = 0
+            self.opened += 1
+
+    def release(self) -> None:
+        """调用未得出结论（被取消、排队被拒等）时归还半开探测名额"""
+        if self._state == self.HALF_OPEN and self._probes > 0:
+            self._probes -= 1
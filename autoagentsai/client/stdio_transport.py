@@ -0,0 +1,382 @@
+import asyncio
+import contextlib
+import itertools
+import logging
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from autoagentsai.utils import tracing
+
+from .codec import CODECS, JSON_LINES, loads, offered_formats
+from .errors import MCPTimeoutError, MCPToolError, MCPTransportError
+
+logger = logging.getLogger(__name__)
+
+# 单行响应上限（asyncio 默认 64KiB，工具列表或大结果可能超出）
+_STREAM_LIMIT = 16 * 1024 * 1024
+# 等待线路格式握手响应的最长秒数
+_HANDSHAKE_TIMEOUT = 10.0
+
+
+class StdioServerProcess:
+    """
+    单个 stdio 服务子进程。
+
+    基于 asyncio.subprocess 实现非阻塞读写，进程启动一次后常驻，
+    跨多次调用复用。每个请求携带递增的 id，由后台读取任务按 id
+    把响应分发给对应的等待者，因此多个请求可以流水线地写入同一管道，
+    并允许服务端乱序返回。
+
+    启动时发送一条带 id 的 LIST 握手：服务端回传 id 说明支持按 id 关联，
+    同时可通过 formats 协商线路格式（如长度前缀的 MessagePack 帧）。
+    不回传 id 的旧版服务继续使用 JSON 行，响应按先进先出匹配，LIST 以不带载荷的形式发送，也不发送 CANCEL。
+    """
+
+    def __init__(self, command: str, args: List[str], env: Optional[Dict[str, str]] = None,
+                 cwd: Optional[str] = None, wire_format: str = "auto"):
+        """
+        :param wire_format: "auto"（安装了 msgpack 时协商 MessagePack 帧）、"msgpack" 或 "json"（不协商格式）
+        """
+        self.command = command
+        self.args = list(args)
+        self.env = env
+        self.cwd = cwd
+        self.process: Optional[asyncio.subprocess.Process] = None
+        # 服务端主动推送的通知（如 tools/list_changed）的回调
+        self.on_notification: Optional[Callable[[Dict[str, Any]], None]] = None
+        self._ids = itertools.count(1)
+        # 在途请求：id -> Future，按发送顺序排列（dict 保持插入顺序）
+        self._pending: Dict[int, asyncio.Future] = {}
+        self._write_lock: Optional[asyncio.Lock] = None
+        self._start_lock: Optional[asyncio.Lock] = None
+        # 握手时声明的线路格式（None 表示不协商格式）与当前进程实际使用的编解码器
+        self._formats = offered_formats(wire_format)
+        self.codec = JSON_LINES
+        # 当前进程是否回传请求 id（握手时探测）
+        self.tagged = False
+        self._reader_task: Optional[asyncio.Task] = None
+        self._stderr_task: Optional[asyncio.Task] = None
+
+    @property
+    def alive(self) -> bool:
+        # 读取任务结束（stdout 已 EOF）后即使进程尚未退出或尚未回收，也不会再有响应到达
+        return (self.process is not None and self.process.returncode is None
+                and self._reader_task is not None and not self._reader_task.done())
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._pending)
+
+    async def start(self) -> None:
+        """启动子进程并完成线路格式握手（已在运行时直接返回）"""
+        if self.alive:
+            return
+        if self._start_lock is None:
+            self._start_lock = asyncio.Lock()
+        async with self._start_lock:
+            if self.alive:
+                return
+            self._discard()
+            try:
+                process = await asyncio.create_subprocess_exec(
+                    self.command,
+                    *self.args,
+                    stdin=asyncio.subprocess.PIPE,
+                    stdout=asyncio.subprocess.PIPE,
+                    stderr=asyncio.subprocess.PIPE,
+                    env=self.env,
+                    cwd=self.cwd,
+                    limit=_STREAM_LIMIT,
+                )
+            except OSError as e:
+                raise MCPTransportError(f"无法启动服务进程 {self.command}: {e}") from e
+            # 持续消费 stderr，避免调试输出写满管道导致服务端阻塞
+            self._stderr_task = asyncio.ensure_future(self._drain_stderr(process))
+            try:
+                codec, tagged = await self._handshake(process)
+            except BaseException:
+                # 握手失败或启动被取消（如调用的截止时间已到）：结束进程，不留下半启动的实例
+                with contextlib.suppress(ProcessLookupError):
+                    process.kill()
+                raise
+            self.codec, self.tagged = codec, tagged
+            self.process = process
+            # 每个进程实例使用独立的在途表，旧进程的读取任务收尾时不会误伤新请求
+            self._pending = {}
+            self._reader_task = asyncio.ensure_future(self._read_responses(process, self._pending, codec))
+
+    def _discard(self) -> None:
+        """结束已失效的旧进程（如关闭了 stdout 却仍在运行），其读取任务遇到 EOF 后自行收尾"""
+        process, self.process = self.process, None
+        if process is not None and process.returncode is None:
+            with contextlib.suppress(ProcessLookupError):
+                process.kill()
+
+    async def _handshake(self, process: asyncio.subprocess.Process):
+        """
+        发送带 id（以及 formats）的 LIST，返回 (服务端选定格式的编解码器, 服务端是否回传 id)。
+
+        握手在进程对外可用之前完成，保证服务端切换格式前管道中没有其他请求；
+        旧版服务忽略 formats 字段或拒绝带载荷的 LIST，响应中没有 format 与 id，继续使用 JSON 行。
+        """
+        payload = {"id": next(self._ids)}
+        if self._formats:
+            payload["formats"] = self._formats
+        try:
+            process.stdin.write(JSON_LINES.encode_request("LIST", payload))
+            await process.stdin.drain()
+            line = await asyncio.wait_for(process.stdout.readline(), _HANDSHAKE_TIMEOUT)
+            if not line:
+                raise MCPTransportError("服务进程已退出")
+        except (BrokenPipeError, ConnectionResetError, asyncio.TimeoutError, MCPTransportError) as e:
+            raise MCPTransportError(f"与服务进程 {self.command} 握手失败: {e!r}") from e
+        try:
+            response = loads(line)
+        except ValueError:
+            logger.warning("[%s] 无法解析握手响应: %r", self.command, line[:200])
+            return JSON_LINES, False
+        if not isinstance(response, dict):
+            return JSON_LINES, False
+        return CODECS.get(response.get("format"), JSON_LINES), response.get("id") == payload["id"]
+
+    async def _drain_stderr(self, process: asyncio.subprocess.Process) -> None:
+        while True:
+            line = await process.stderr.readline()
+            if not line:
+                break
+            logger.debug("[%s] %s", self.command, line.decode(errors="replace").rstrip())
+
+    async def _read_responses(self, process: asyncio.subprocess.Process,
+                              pending: Dict[int, asyncio.Future], codec) -> None:
+        """后台读取任务：逐条解析响应并按 id 唤醒等待者"""
+        try:
+            while True:
+                data = await codec.read(process.stdout)
+                if data is None:
+                    break
+                started = time.perf_counter() if tracing.is_enabled() else None
+                try:
+                    message = codec.decode(data)
+                except ValueError:
+                    logger.warning("[%s] 无法解析服务响应: %r", self.command, data[:200])
+                    continue
+                if started is not None:
+                    # 读取任务不属于任何调用的上下文，只计入耗时统计
+                    tracing.record("stdio.decode", time.perf_counter() - started)
+                self._dispatch(message, pending)
+        finally:
+            self._fail_pending(pending, MCPTransportError("服务进程已退出"))
+
+    def _dispatch(self, message: Dict[str, Any], pending: Dict[int, asyncio.Future]) -> None:
+        if "method" in message and "id" not in message:
+            if self.on_notification is not None:
+                self.on_notification(message)
+            return
+        future = None
+        if "id" in message:
+            future = pending.pop(message["id"], None)
+        elif pending:
+            # 旧版服务不回传 id：严格一问一答，按发送顺序匹配最早的请求
+            future = pending.pop(next(iter(pending)))
+        if future is None:
+            # 调用方超时或取消后服务仍可能写回结果
+            logger.debug("[%s] 收到无人等待的响应: %r", self.command, message)
+        elif not future.done():
+            future.set_result(message)
+
+    @staticmethod
+    def _fail_pending(pending: Dict[int, asyncio.Future], exc: Exception) -> None:
+        futures = list(pending.values())
+        pending.clear()
+        for future in futures:
+            if not future.done():
+                future.set_exception(exc)
+
+    async def request(self, action: str, payload: Optional[Dict[str, Any]] = None,
+                      timeout: Optional[float] = None) -> Dict[str, Any]:
+        """
+        发送一条命令并等待 id 匹配的 JSON 响应。
+
+        :param action: 命令名，如 "LIST" 或 "INVOKE"
+        :param payload: 命令载荷，会自动附加请求 id
+        :param timeout: 等待响应的最长秒数，超时或调用方被取消时向服务发送 CANCEL
+        :return: 解析后的响应字典
+        """
+        if self._write_lock is None:
+            self._write_lock = asyncio.Lock()
+        with tracing.span("stdio.request", command=self.command, action=action) as span:
+            request_id = next(self._ids)
+            message = dict(payload or {}, id=request_id)
+            meta = tracing.inject({})
+            if meta:
+                message["_meta"] = meta
+
+            future = asyncio.get_running_loop().create_future()
+            pending: Dict[int, asyncio.Future] = {}
+            tagged = True
+            try:
+                # 写锁只保护单条写入，不等待响应，多个请求可同时在途
+                with tracing.span("stdio.write") as write_span:
+                    async with self._write_lock:
+                        # 进程意外退出（或读取任务已结束）后在下一次请求时自动重启；
+                        # 请求只登记到读取任务仍在运行的进程上，读取任务退出时会立即让它失败。
+                        # 编码放在启动之后，使用握手选定的格式
+                        await self.start()
+                        with tracing.span("stdio.encode", format=self.codec.name):
+                            # 旧版服务只认不带载荷的 LIST，其响应按先进先出匹配
+                            bare = action == "LIST" and not self.tagged
+                            data = self.codec.encode_request(action, None if bare else message)
+                        write_span.set_attribute("bytes", len(data))
+                        pending, tagged = self._pending, self.tagged
+                        pending[request_id] = future
+                        try:
+                            self.process.stdin.write(data)
+                            await self.process.stdin.drain()
+                        except (BrokenPipeError, ConnectionResetError) as e:
+                            raise MCPTransportError(f"与服务进程的管道已断开: {e}") from e
+                try:
+                    with tracing.span("stdio.wait"):
+                        response = await asyncio.wait_for(asyncio.shield(future), timeout)
+                except asyncio.TimeoutError:
+                    self._cancel(request_id)
+                    raise MCPTimeoutError(f"{action} 请求超过 {timeout:.2f}s 未返回") from None
+                except asyncio.CancelledError:
+                    self._cancel(request_id)
+                    raise
+            finally:
+                if tagged or future.done():
+                    pending.pop(request_id, None)
+                else:
+                    # 旧版服务按先进先出应答且不支持 CANCEL：被放弃的请求保留为已取消的占位，
+                    # 它迟到的响应到达时被丢弃，不会错配给后面的请求
+                    future.cancel()
+            server_timing = response.get("_meta", {}).get("timing")
+            if server_timing:
+                # 服务端回传的执行耗时，便于区分管道开销与计算本身
+                for key, value in server_timing.items():
+                    span.set_attribute(f"server.{key}", value)
+            return response
+
+    def _cancel(self, request_id: int) -> None:
+        """通知服务放弃仍在执行的请求（尽力而为，不等待结果）；旧版服务不支持 CANCEL，会把它当作未知命令应答"""
+        if self.alive and self.tagged:
+            try:
+                self.process.stdin.write(self.codec.encode_request("CANCEL", {"id": request_id}))
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+
+    async def close(self, timeout: float = 2.0) -> None:
+        """关闭子进程：先关闭 stdin 让服务自然退出，超时后强制结束"""
+        process = self.process
+        if process is None:
+            return
+        self.process = None
+        if process.returncode is None:
+            try:
+                process.stdin.close()
+                await asyncio.wait_for(process.wait(), timeout)
+            except asyncio.TimeoutError:
+                process.kill()
+                await process.wait()
+            except (BrokenPipeError, ConnectionResetError):
+                await process.wait()
+        for task in (self._reader_task, self._stderr_task):
+            if task is not None:
+                task.cancel()
+        self._reader_task = self._stderr_task = None
+        self._fail_pending(self._pending, MCPTransportError("服务进程已关闭"))
+
+
+class StdioTransport:
+    """
+    stdio 传输层：为一个配置好的服务维护 N 个常驻工作进程。
+
+    pool_size > 1 时，请求分发到当前在途请求最少的进程，
+    使 math_server 这类 CPU 密集型服务可以利用多个核心。
+    """
+
+    def __init__(self, config: Dict[str, Any]):
+        command = config.get("command")
+        if not command:
+            raise ValueError("Missing 'command' for stdio service")
+
+        pool_size = int(config.get("pool_size", 1))
+        if pool_size < 1:
+            raise ValueError("'pool_size' must be >= 1")
+
+        self.workers = [
+            StdioServerProcess(command, config.get("args", []), config.get("env"), config.get("cwd"),
+                               config.get("wire_format", "auto"))
+            for _ in range(pool_size)
+        ]
+        self._rr = itertools.count()
+        self._start_lock: Optional[asyncio.Lock] = None
+        # 服务端在 LIST 响应中自报的版本号
+        self.server_version: Optional[str] = None
+        self.on_notification: Optional[Callable[[Dict[str, Any]], None]] = None
+        for worker in self.workers:
+            worker.on_notification = self._notify
+
+    def _notify(self, message: Dict[str, Any]) -> None:
+        if self.on_notification is not None:
+            self.on_notification(message)
+
+    async def start(self) -> None:
+        """并发启动全部工作进程（幂等）"""
+        # 每次调用都会经过这里：全部进程存活时不取锁直接返回
+        if all(worker.alive for worker in self.workers):
+            return
+        if self._start_lock is None:
+            self._start_lock = asyncio.Lock()
+        async with self._start_lock:
+            await asyncio.gather(*(worker.start() for worker in self.workers))
+
+    def _pick_worker(self) -> StdioServerProcess:
+        # 在途请求最少者优先，相同时轮询，避免总是压在第一个进程上
+        offset = next(self._rr) % len(self.workers)
+        ordered = self.workers[offset:] + self.workers[:offset]
+        return min(ordered, key=lambda worker: worker.in_flight)
+
+    async def list_tools(self) -> List[Dict[str, Any]]:
+        """获取服务端工具列表"""
+        response = await self._pick_worker().request("LIST")
+        if "error" in response:
+            raise MCPToolError(response["error"])
+        self.server_version = response.get("version")
+        return response.get("tools", [])
+
+    async def call_tool(self, tool_name: str, arguments: Optional[Dict[str, Any]] = None,
+                        timeout: Optional[float] = None) -> Any:
+        """
+        调用工具并返回 result 字段。
+
+        :param timeout: 调用的剩余时间（秒），随请求发给服务端作为执行时限
+        """
+        payload = {"name": tool_name, "parameters": arguments or {}}
+        if timeout is not None:
+            payload["timeout"] = timeout
+        response = await self._pick_worker().request("INVOKE", payload, timeout)
+        if "error" in response:
+            raise MCPToolError(response["error"])
+        return response.get("result")
+
+    async def batch_call_tool(self, tool_name: str, arguments_list: List[Dict[str, Any]],
+                              timeout: Optional[float] = None) -> List[Any]:
+        """
+        通过一条 BATCH_INVOKE 命令批量调用工具，结果按输入顺序返回。
+
+        单项失败不影响其他项，失败项以 MCPToolError 实例占位。
+        """
+        payload = {"name": tool_name, "parameters": list(arguments_list)}
+        if timeout is not None:
+            payload["timeout"] = timeout
+        response = await self._pick_worker().request("BATCH_INVOKE", payload, timeout)
+        if "error" in response:
+            raise MCPToolError(response["error"])
+        return [
+            MCPToolError(item["error"]) if "error" in item else item.get("result")
+            for item in response.get("results", [])
+        ]
+
+    async def close(self) -> None:
+        await asyncio.gather(*(worker.close() for worker in self.workers))
@@ -1,3 +1,16 @@
-from .create_react_agent import create_react_agent
+# 依赖 langchain 的 Agent 构建工具，首次访问时才导入（PEP 562）
+import importlib
 
-__all__ = ["create_react_agent"]
\ No newline at end of file
+__all__ = ["AgentFactory", "create_react_agent"]
+
+
+def __getattr__(name):
+    if name in __all__:
+        value = getattr(importlib.import_module(".create_react_agent", __name__), name)
+        globals()[name] = value
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
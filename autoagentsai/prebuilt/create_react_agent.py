@@ -65,101 +65,295 @@
 
 # autoagentsai/prebuilt/create_react_agent.py
 
-from langchain.agents import AgentExecutor, create_openai_functions_agent
-from langchain.chat_models import ChatOpenAI  # 直接导入ChatOpenAI
-from langchain.prompts import PromptTemplate
-from langchain_core.tools import BaseTool
+import asyncio
+import contextlib
+import hashlib
+import inspect
+import json
+import math
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional, Union
 
+from langchain.agents import AgentExecutor, create_openai_tools_agent
+from langchain.prompts import ChatPromptTemplate, MessagesPlaceholder
 from langchain.tools import BaseTool
-from langchain.agents import create_openai_functions_agent, AgentExecutor
-from langchain.prompts import PromptTemplate
-from langchain.chat_models import ChatOpenAI
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.utils.function_calling import convert_to_openai_tool
 
-def create_react_agent(llm_model: str, tools: list):
+from autoagentsai.utils import deadline, tracing
+from autoagentsai.utils.cache import TTLCache
+
+# 提示词模板：工具说明通过 function calling 传给模型，
+# agent_scratchpad 中是此前各轮的工具调用及其结果消息
+PROMPT = ChatPromptTemplate.from_messages([
+    ("system", "Answer the following questions as best you can using the available tools. "
+               "When several independent tool calls are needed, request them all in the same turn."),
+    ("human", "{input}"),
+    MessagesPlaceholder("agent_scratchpad"),
+])
+
+
+class LLMTimingCallback(BaseCallbackHandler):
+    """把每次 LLM 调用的耗时计入 tracing 统计（"agent.llm"），用于区分模型耗时与工具耗时"""
+
+    # 同步回调在事件循环中直接执行，不转到线程池
+    run_inline = True
+
+    def __init__(self):
+        self._started: Dict[Any, float] = {}
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs) -> None:
+        if tracing.is_enabled():
+            self._started[run_id] = time.perf_counter()
+
+    def on_llm_start(self, serialized, prompts, *, run_id, **kwargs) -> None:
+        if tracing.is_enabled():
+            self._started[run_id] = time.perf_counter()
+
+    def on_llm_end(self, response, *, run_id, **kwargs) -> None:
+        self._finish(run_id)
+
+    def on_llm_error(self, error, *, run_id, **kwargs) -> None:
+        self._finish(run_id)
+
+    def _finish(self, run_id) -> None:
+        started = self._started.pop(run_id, None)
+        if started is not None:
+            tracing.record("agent.llm", time.perf_counter() - started)
+
+
+class ServerConcurrencyLimiter:
+    """
+    按服务限制同时在途的工具调用数。
+
+    模型在同一轮中发起的多个工具调用由 AgentExecutor 并发执行，
+    limits 可以是对每个服务统一生效的整数，也可以是 {服务名: 上限} 的字典，未配置的服务不限流。
+    """
+
+    def __init__(self, limits: Union[int, Dict[str, int], None] = None):
+        self.limits = limits
+        self._semaphores: Dict[Optional[str], asyncio.Semaphore] = {}
+
+    def limit(self, server: Optional[str]) -> Optional[int]:
+        if isinstance(self.limits, dict):
+            return self.limits.get(server)
+        return self.limits
+
+    @contextlib.asynccontextmanager
+    async def slot(self, server: Optional[str]):
+        """占用服务的一个并发名额，名额用尽时等待"""
+        limit = self.limit(server)
+        if not limit:
+            yield
+            return
+        semaphore = self._semaphores.get(server)
+        if semaphore is None:
+            semaphore = self._semaphores[server] = asyncio.Semaphore(limit)
+        async with semaphore:
+            yield
+
+
+class AgentFactory:
+    """
+    可复用的 Agent 工厂，适合每个请求都创建一个 Agent 的服务。
+
+    LLM 客户端按 (模型名, 参数) 缓存，多个 Agent 共享同一个 HTTP 连接池；
+    工具包装结果和绑定了工具的 agent 按工具目录指纹缓存（LRU，最多 max_toolsets 组）。
+    create() 只需新建一个轻量的 AgentExecutor。
+    """
+
+    def __init__(self, *, max_toolsets: int = 32, verbose: bool = True,
+                 llm_factory: Optional[Callable[..., Any]] = None):
+        """
+        Args:
+            max_toolsets: 缓存的工具集（工具包装 + agent）数量上限
+            verbose: 是否输出 Agent 执行日志
+            llm_factory: 创建 LLM 客户端的可调用对象，以 model_name 及其他参数调用，默认 ChatOpenAI
+                （首次创建 LLM 时才导入）
+        """
+        self.verbose = verbose
+        self.llm_factory = llm_factory
+        self._llms: Dict[str, Any] = {}
+        self._toolsets = TTLCache(maxsize=max_toolsets)
+        self._llm_timer = LLMTimingCallback()
+
+    def get_llm(self, llm_model: str, **settings):
+        """
+        获取（必要时创建）LLM 客户端。
+
+        Args:
+            llm_model: LLM模型名称（如"gpt-4o"或"openai:gpt-4o"）
+            **settings: 传给 ChatOpenAI 的其他参数，默认 temperature=0
+        """
+        # 解析模型名称（处理"openai:"前缀）
+        if llm_model.startswith("openai:"):
+            model_name = llm_model[7:]  # 去掉"openai:"前缀
+        else:
+            model_name = llm_model
+        settings = dict({"temperature": 0, "verbose": self.verbose}, **settings)  # 温度为0使输出更确定
+        key = json.dumps([model_name, settings], sort_keys=True, default=repr)
+        llm = self._llms.get(key)
+        if llm is None:
+            # 计时回调挂在 LLM 上（AgentExecutor 上的回调不会传给子调用），追踪关闭时回调直接返回
+            settings["callbacks"] = [self._llm_timer, *(settings.get("callbacks") or [])]
+            llm_factory = self.llm_factory or _chat_openai()
+            llm = self._llms.setdefault(key, llm_factory(model_name=model_name, **settings))
+        return llm
+
+    def create(self, llm_model: str, tools: list, *,
+               max_concurrency: Union[int, Dict[str, int], None] = None,
+               tool_timeout: Optional[float] = None, **llm_settings) -> AgentExecutor:
+        """
+        创建一个 AgentExecutor，LLM 客户端、工具包装和 agent 均复用缓存。
+
+        Args:
+            llm_model: LLM模型名称（如"gpt-4o"或"openai:gpt-4o"）
+            tools: 工具列表（可以是BaseTool实例或包含name/description属性的对象）
+            max_concurrency: 每个服务同时执行的工具调用上限，见 create_react_agent
+            tool_timeout: 每次工具调用的截止时间（秒），见 create_react_agent
+            **llm_settings: 传给 ChatOpenAI 的其他参数
+        """
+        llm = self.get_llm(llm_model, **llm_settings)
+        key = json.dumps(
+            [id(llm), max_concurrency, tool_timeout, [_fingerprint(tool) for tool in tools]],
+            sort_keys=True, default=repr,
+        )
+        key = hashlib.sha256(key.encode()).hexdigest()
+        toolset = self._toolsets.get(key)
+        if toolset is None:
+            limiter = ServerConcurrencyLimiter(max_concurrency)
+            # 确保工具是BaseTool类型，普通对象转换为FunctionTool
+            processed_tools = [
+                tool if isinstance(tool, BaseTool) else _to_function_tool(tool, limiter, tool_timeout)
+                for tool in tools
+            ]
+            # 创建agent：工具的参数 schema 通过 tools 参数绑定到模型
+            agent = create_openai_tools_agent(llm, [_tool_spec(tool) for tool in processed_tools], PROMPT)
+            toolset = (agent, processed_tools)
+            self._toolsets.set(key, toolset, math.inf)
+        agent, processed_tools = toolset
+        return AgentExecutor(agent=agent, tools=processed_tools, verbose=self.verbose)
+
+
+def _chat_openai():
+    """默认的 LLM 客户端类；langchain_community 导入较慢，推迟到第一次创建 LLM 时"""
+    from langchain_community.chat_models import ChatOpenAI
+    return ChatOpenAI
+
+
+# create_react_agent 共用的默认工厂
+_default_factory = AgentFactory()
+
+
+def create_react_agent(llm_model: str, tools: list, *,
+                       max_concurrency: Union[int, Dict[str, int], None] = None,
+                       tool_timeout: Optional[float] = None):
     """
     创建ReAct agent，支持传入LLM模型名称和工具列表
+
+    基于 OpenAI tools（并行函数调用）构建：模型在一轮中发起的多个工具调用会被并发执行，
+    结果按调用顺序回填，一轮耗时取决于最慢的工具而不是所有工具耗时之和。
+    相同模型与工具目录的重复调用复用默认 AgentFactory 中缓存的 LLM 客户端和工具包装。
     
     Args:
         llm_model: LLM模型名称（如"gpt-4o"或"openai:gpt-4o"）
         tools: 工具列表（可以是BaseTool实例或包含name/description属性的对象）
+        max_concurrency: 每个服务同时执行的工具调用上限，整数对所有服务生效，
+            也可以传 {服务名: 上限}；None 表示不限制
+        tool_timeout: 每次工具调用的截止时间（秒），作为 deadline.scope 传给 MCPClient，
+            排队、启动服务与重试都计入其中；外层 deadline.scope() 更早到期时以外层为准
     """
-    # 解析模型名称（处理"openai:"前缀）
-    if llm_model.startswith("openai:"):
-        model_name = llm_model[7:]  # 去掉"openai:"前缀
-    else:
-        model_name = llm_model
-    
-    # 初始化LLM
-    llm = ChatOpenAI(
-        model_name=model_name,
-        temperature=0,  # 设置温度为0，使输出更确定
-        verbose=True    # 启用详细日志
-    )
-    
-    # 构建提示词模板
-    prompt_template = """Answer the following questions as best you can. You have access to the following tools:
+    return _default_factory.create(llm_model, tools, max_concurrency=max_concurrency, tool_timeout=tool_timeout)
 
-{tools}
 
-Use the following format:
+def _fingerprint(tool: Any) -> Any:
+    """
+    工具的缓存指纹。
 
-Question: {input}
-Thought: You should always think about what to do
-Action: The action to take, should be one of [{tool_names}]
-Action Input: The input to the action
-Observation: The result of the action
-... (this Thought/Action/Action Input/Observation can repeat N times)
-Thought: I now know the final answer
-Final Answer: The final answer to the original input question
+    MCP 工具每次发现都会新建对象，按所属客户端与工具定义计算指纹；
+    其他工具按对象身份区分（缓存条目持有工具引用，id 不会被复用）。
+    """
+    client = getattr(tool, "client", None)
+    if client is None or isinstance(tool, BaseTool):
+        return ["object", id(tool)]
+    return [
+        id(client),
+        getattr(tool, "server", None),
+        getattr(tool, "tool_name", None),
+        getattr(tool, "name", None),
+        getattr(tool, "description", ""),
+        getattr(tool, "parameters", {}),
+    ]
 
-Begin!
 
-{agent_scratchpad}
+def _not_implemented(*args, **kwargs) -> str:
+    return "Tool execution not implemented"
 
-Question: {input}
-"""
 
-    # 确保工具是BaseTool类型
-    processed_tools = []
-    for tool in tools:
-        if isinstance(tool, BaseTool):
-            processed_tools.append(tool)
-        else:
-            # 将普通对象转换为FunctionTool
-            processed_tools.append(
-                FunctionTool(
-                    name=getattr(tool, "name", "unknown"),
-                    description=getattr(tool, "description", ""),
-                    func=lambda *args, **kwargs: getattr(tool, "run", lambda *a, **kw: "Tool execution not implemented")(*args, **kwargs),
-                    parameters=getattr(tool, "parameters", {})
-                )
-            )
-    
-    # 格式化工具描述和名称
-    tools_description = "\n".join([f"{tool.name}: {tool.description}" for tool in processed_tools])
-    tool_names = ", ".join([tool.name for tool in processed_tools])
-    
-    # 创建提示词
-    prompt = PromptTemplate(
-        template=prompt_template,
-        input_variables=["input", "agent_scratchpad", "tools", "tool_names"]
+def _to_function_tool(tool: Any, limiter: Optional[ServerConcurrencyLimiter] = None,
+                      timeout: Optional[float] = None) -> "FunctionTool":
+    """
+    把包含 name/description 的普通对象包装为 FunctionTool。
+
+    run/arun 在此处取成绑定方法，每个包装器固定指向自己的工具，
+    不会像在循环里写 lambda 那样因延迟绑定全部指向最后一个工具。
+    """
+    coroutine = getattr(tool, "arun", None)
+    if not inspect.iscoroutinefunction(coroutine):
+        coroutine = None
+    return FunctionTool(
+        name=getattr(tool, "name", "unknown"),
+        description=getattr(tool, "description", ""),
+        func=getattr(tool, "run", None) or _not_implemented,
+        coroutine=coroutine,
+        parameters=getattr(tool, "parameters", {}),
+        server=getattr(tool, "server", None),
+        limiter=limiter,
+        timeout=timeout,
     )
-    prompt = prompt.partial(tools=tools_description, tool_names=tool_names)
 
-    # 创建agent
-    agent = create_openai_functions_agent(llm, processed_tools, prompt)
 
-    return AgentExecutor(agent=agent, tools=processed_tools, verbose=True)
+def _tool_spec(tool: BaseTool) -> Dict[str, Any]:
+    """生成 OpenAI tools 格式的工具定义，FunctionTool 直接使用 MCP 服务提供的 JSON Schema"""
+    if isinstance(tool, FunctionTool):
+        return {
+            "type": "function",
+            "function": {
+                "name": tool.name,
+                "description": tool.description,
+                "parameters": tool.parameters or {"type": "object", "properties": {}},
+            },
+        }
+    return convert_to_openai_tool(tool)
+
 
 # 辅助类：用于将普通对象转换为LangChain工具
 class FunctionTool(BaseTool):
     name: str
     description: str
-    func: callable
+    func: Callable[..., Any]
+    # 原生异步实现（如 MCPTool.arun），存在时 _arun 直接 await 它
+    coroutine: Optional[Callable[..., Awaitable[Any]]] = None
     parameters: dict = {}
+    # 工具所属服务，用于按服务限流
+    server: Optional[str] = None
+    limiter: Optional[ServerConcurrencyLimiter] = None
+    # 每次调用的截止时间（秒），在调用期间作为 deadline.scope 生效
+    timeout: Optional[float] = None
     
     def _run(self, *args, **kwargs) -> str:
         return self.func(*args, **kwargs)
-    
+
     async def _arun(self, *args, **kwargs) -> str:
-        return self.func(*args, **kwargs)
\ No newline at end of file
+        # 截止时间从进入包装器开始计算，等待并发名额的时间也计入其中
+        with tracing.span("agent.tool", tool=self.name, server=self.server), deadline.scope(self.timeout):
+            if self.limiter is None:
+                return await self._call(*args, **kwargs)
+            async with self.limiter.slot(self.server):
+                return await self._call(*args, **kwargs)
+
+    async def _call(self, *args, **kwargs) -> Any:
+        if self.coroutine is not None:
+            return await self.coroutine(*args, **kwargs)
+        # 只有同步实现时放到线程池执行，避免阻塞事件循环上的其他 Agent
+        return await asyncio.to_thread(self.func, *args, **kwargs)
@@ -0,0 +1,5 @@
+from .cache import CacheBackend, SQLiteCache, TTLCache
+from .metrics import MetricsRegistry
+from .singleflight import SingleFlight
+
+__all__ = ["CacheBackend", "MetricsRegistry", "SQLiteCache", "SingleFlight", "TTLCache"]
\ No newline at end of file
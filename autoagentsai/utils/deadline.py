@@ -0,0 +1,37 @@
+import contextlib
+import contextvars
+import time
+from typing import Iterator, Optional
+
+# 当前协程所处的截止时刻（time.monotonic()），随 asyncio 任务的上下文向下传递
+_deadline: "contextvars.ContextVar[Optional[float]]" = contextvars.ContextVar("autoagentsai_deadline", default=None)
+
+
+@contextlib.contextmanager
+def scope(timeout: Optional[float]) -> Iterator[None]:
+    """
+    为其中发起的所有工具调用设置截止时间，用法：with deadline.scope(30): await executor.ainvoke(...)
+
+    嵌套时取更早的截止时间；timeout 为 None 时沿用外层的截止时间。
+    """
+    if timeout is None:
+        yield
+        return
+    at = time.monotonic() + timeout
+    current = _deadline.get()
+    token = _deadline.set(at if current is None else min(at, current))
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def current() -> Optional[float]:
+    """当前截止时刻（time.monotonic()），没有截止时间时返回 None"""
+    return _deadline.get()
+
+
+def remaining() -> Optional[float]:
+    """当前截止时间的剩余秒数，没有截止时间时返回 None"""
+    at = _deadline.get()
+    return None if at is None else at - time.monotonic()
@@ -0,0 +1,198 @@
+import bisect
+import math
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+# Prometheus 文本格式（exposition format 0.0.4）的 Content-Type
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# 默认延迟分桶（秒），覆盖本地计算到慢速上游的范围
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+class _Metric:
+    """带标签的指标基类；标签值按 labelnames 的顺序组成元组作为键"""
+
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], Any] = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, Any]) -> Tuple[str, ...]:
+        if len(labels) != len(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _labels(self, key: Tuple[str, ...], extra: Iterable[Tuple[str, str]] = ()) -> str:
+        pairs = [*zip(self.labelnames, key), *extra]
+        if not pairs:
+            return ""
+        return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            return [f"{self.name}{self._labels(key)} {_format_value(value)}"
+                    for key, value in sorted(self._values.items())]
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}", *self._samples()]
+
+
+class Counter(_Metric):
+    """只增不减的计数器"""
+
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels: Any) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels: Any) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def values(self) -> Dict[Tuple[str, ...], float]:
+        """所有标签组合的当前值"""
+        with self._lock:
+            return dict(self._values)
+
+
+class Gauge(Counter):
+    """可增可减的瞬时值，如在途请求数、活跃会话数"""
+
+    kind = "gauge"
+
+    def dec(self, amount: float = 1, **labels: Any) -> None:
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels: Any) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(_Metric):
+    """按固定分桶累计观测值的直方图，同时记录总和与次数"""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels: Any) -> None:
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # 每个桶（含 +Inf）的非累计次数、总和、次数
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def _samples(self) -> List[str]:
+        lines = []
+        with self._lock:
+            items = sorted((key, (list(counts), total, count)) for key, (counts, total, count) in self._values.items())
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip((*self.buckets, math.inf), counts):
+                cumulative += bucket_count
+                lines.append(f"{self.name}_bucket{self._labels(key, [('le', _format_value(float(bound)))])} "
+                             f"{cumulative}")
+            lines.append(f"{self.name}_sum{self._labels(key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{self._labels(key)} {count}")
+        return lines
+
+    def snapshot(self, **labels: Any) -> Dict[str, Any]:
+        """
+        单个标签组合的摘要：count、mean_ms、按分桶线性插值估算的 p50/p95/p99（毫秒）
+        以及累计分桶 buckets（{上界秒数: 次数}）
+        """
+        with self._lock:
+            state = self._values.get(self._key(labels))
+            counts, total, count = (list(state[0]), state[1], state[2]) if state else (
+                [0] * (len(self.buckets) + 1), 0.0, 0)
+        cumulative, buckets = 0, {}
+        for bound, bucket_count in zip((*self.buckets, math.inf), counts):
+            cumulative += bucket_count
+            buckets[_format_value(float(bound))] = cumulative
+        to_ms = lambda seconds: round(seconds * 1000, 3)
+        return {
+            "count": count,
+            "mean_ms": to_ms(total / count) if count else 0.0,
+            "p50_ms": to_ms(self._quantile(counts, count, 0.50)),
+            "p95_ms": to_ms(self._quantile(counts, count, 0.95)),
+            "p99_ms": to_ms(self._quantile(counts, count, 0.99)),
+            "buckets": buckets,
+        }
+
+    def _quantile(self, counts: List[int], count: int, q: float) -> float:
+        """与 Prometheus histogram_quantile 相同的估算：在目标分桶内线性插值，落在 +Inf 桶时取最大有限上界"""
+        if not count:
+            return 0.0
+        rank = q * count
+        cumulative = 0
+        for index, bucket_count in enumerate(counts):
+            if cumulative + bucket_count >= rank and bucket_count:
+                if index == len(self.buckets):
+                    return self.buckets[-1]
+                lower = self.buckets[index - 1] if index else 0.0
+                return lower + (self.buckets[index] - lower) * (rank - cumulative) / bucket_count
+            cumulative += bucket_count
+        return self.buckets[-1]
+
+
+class MetricsRegistry:
+    """
+    一组指标的注册表，render() 输出 Prometheus 文本格式。
+
+    counter / gauge / histogram 按名称取已有指标或新建，重复注册同名指标会返回同一对象。
+    """
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, cls, name: str, documentation: str, labelnames: Sequence[str], **kwargs) -> Any:
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, documentation, labelnames, **kwargs)
+            elif type(metric) is not cls:
+                raise ValueError(f"Metric '{name}' is already registered as a {metric.kind}")
+            return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._get_or_create(Counter, name, documentation, labelnames)
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._get_or_create(Gauge, name, documentation, labelnames)
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Optional[Sequence[float]] = None) -> Histogram:
+        return self._get_or_create(Histogram, name, documentation, labelnames, buckets=buckets or DEFAULT_BUCKETS)
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return "\n".join(line for metric in metrics for line in metric.render()) + "\n"
@@ -0,0 +1,37 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+
+class SingleFlight:
+    """
+    请求合并（single-flight）：同一 key 同一时刻只有一个调用在途，
+    并发到达的其他调用者等待并共享这次调用的结果或异常。
+    """
+
+    def __init__(self):
+        self.coalesced = 0
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+
+    def __len__(self) -> int:
+        return len(self._inflight)
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        执行 fn() 或加入 key 对应的在途调用。
+
+        调用在独立任务中运行，单个调用者被取消不会中断其他等待者。
+        """
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._inflight[key] = task
+            task.add_done_callback(lambda done: self._forget(key, done))
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(task)
+
+    def _forget(self, key: Hashable, task: asyncio.Future) -> None:
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled():
+            task.exception()  # 标记异常已读取，避免无人等待时告警
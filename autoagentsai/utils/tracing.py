@@ -0,0 +1,242 @@
+import contextlib
+import contextvars
+import os
+import re
+import threading
+import time
+from typing import Any, Callable, Dict, Iterator, Optional
+
+# OpenTelemetry 为可选依赖，在 enable() 时才导入，不影响包的导入耗时
+otel_context = otel_propagate = otel_trace = None
+
+# 追踪开关；关闭时 span() 直接返回共享的空对象，热路径只多一次全局变量判断
+_enabled = False
+_otel_tracer = None
+_on_span: Optional[Callable[["Span"], None]] = None
+
+# 当前协程/线程中的活动 span，跨 await 自动传递
+_current: "contextvars.ContextVar[Optional[SpanContext]]" = contextvars.ContextVar(
+    "autoagentsai_span", default=None)
+
+_TRACEPARENT = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-[0-9a-f]{2}$")
+
+
+class SpanContext:
+    """W3C trace context 中的 trace_id / span_id"""
+
+    __slots__ = ("trace_id", "span_id")
+
+    def __init__(self, trace_id: str, span_id: str):
+        self.trace_id = trace_id
+        self.span_id = span_id
+
+    @property
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-01"
+
+
+class Timings:
+    """按 span 名称累计的耗时统计，线程安全"""
+
+    def __init__(self):
+        self._stats: Dict[str, list] = {}
+        self._lock = threading.Lock()
+
+    def record(self, name: str, seconds: float) -> None:
+        with self._lock:
+            stats = self._stats.get(name)
+            if stats is None:
+                self._stats[name] = [1, seconds, seconds]
+            else:
+                stats[0] += 1
+                stats[1] += seconds
+                stats[2] = max(stats[2], seconds)
+
+    def snapshot(self) -> Dict[str, Dict[str, float]]:
+        """返回 {名称: {count, total_ms, mean_ms, max_ms}}"""
+        with self._lock:
+            return {
+                name: {
+                    "count": count,
+                    "total_ms": round(total * 1000, 3),
+                    "mean_ms": round(total / count * 1000, 3),
+                    "max_ms": round(peak * 1000, 3),
+                }
+                for name, (count, total, peak) in self._stats.items()
+            }
+
+    def reset(self) -> None:
+        with self._lock:
+            self._stats.clear()
+
+
+timings = Timings()
+
+
+class _NoopSpan:
+    """追踪关闭时使用的空 span"""
+
+    __slots__ = ()
+
+    def __enter__(self) -> "_NoopSpan":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        return None
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        return None
+
+
+_NOOP = _NoopSpan()
+
+
+class Span:
+    """
+    一段计时区间。
+
+    退出时把耗时计入 timings，有 OpenTelemetry 时同时生成 OTel span，
+    并按 enable(on_span=...) 的回调导出。
+    """
+
+    __slots__ = ("name", "attributes", "context", "parent_id", "start", "duration", "error",
+                 "_token", "_otel")
+
+    def __init__(self, name: str, attributes: Dict[str, Any]):
+        self.name = name
+        self.attributes = attributes
+        self.parent_id: Optional[str] = None
+        self.start = 0.0
+        self.duration = 0.0
+        self.error: Optional[str] = None
+        self._otel = None
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+        if self._otel is not None:
+            otel_trace.get_current_span().set_attribute(key, value)
+
+    def __enter__(self) -> "Span":
+        parent = _current.get()
+        if parent is None:
+            self.context = SpanContext(os.urandom(16).hex(), os.urandom(8).hex())
+        else:
+            self.parent_id = parent.span_id
+            self.context = SpanContext(parent.trace_id, os.urandom(8).hex())
+        self._token = _current.set(self.context)
+        if _otel_tracer is not None:
+            self._otel = _otel_tracer.start_as_current_span(self.name, attributes=_otel_attributes(self.attributes))
+            self._otel.__enter__()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.duration = time.perf_counter() - self.start
+        if exc_type is not None:
+            self.error = exc_type.__name__
+        if self._otel is not None:
+            if self.attributes:
+                otel_trace.get_current_span().set_attributes(_otel_attributes(self.attributes))
+            self._otel.__exit__(exc_type, exc, tb)
+        _current.reset(self._token)
+        timings.record(self.name, self.duration)
+        if _on_span is not None:
+            _on_span(self)
+
+
+def _otel_attributes(attributes: Dict[str, Any]) -> Dict[str, Any]:
+    return {key: value if isinstance(value, (str, bool, int, float)) else str(value)
+            for key, value in attributes.items() if value is not None}
+
+
+def _import_opentelemetry() -> bool:
+    global otel_context, otel_propagate, otel_trace
+    if otel_trace is None:
+        try:
+            from opentelemetry import context, propagate, trace
+        except ImportError:
+            return False
+        otel_context, otel_propagate, otel_trace = context, propagate, trace
+    return True
+
+
+def _otel_recording() -> bool:
+    """当前 OTel span 是否有效且在记录（只有这时 OTel propagator 才会写出 traceparent）"""
+    current = otel_trace.get_current_span()
+    return current.get_span_context().is_valid and current.is_recording()
+
+
+def enable(*, opentelemetry: bool = False, on_span: Optional[Callable[[Span], None]] = None) -> None:
+    """
+    开启追踪。
+
+    :param opentelemetry: 是否同时生成 OpenTelemetry span（需要 opentelemetry-api，并由调用方配置 TracerProvider）
+    :param on_span: 每个 span 结束时调用的回调，可用于记录日志或自定义导出
+    """
+    global _enabled, _otel_tracer, _on_span
+    if opentelemetry and not _import_opentelemetry():
+        raise RuntimeError("opentelemetry-api is not installed")
+    _otel_tracer = otel_trace.get_tracer("autoagentsai") if opentelemetry else None
+    _on_span = on_span
+    _enabled = True
+
+
+def disable() -> None:
+    """关闭追踪，之后的 span() 调用不再计时"""
+    global _enabled, _otel_tracer, _on_span
+    _enabled = False
+    _otel_tracer = None
+    _on_span = None
+
+
+def is_enabled() -> bool:
+    return _enabled
+
+
+def span(name: str, **attributes: Any):
+    """
+    创建一个计时区间，用法：with tracing.span("mcp.invoke", server="math"): ...
+
+    追踪关闭时返回共享的空对象，不分配内存也不读时钟。
+    """
+    if not _enabled:
+        return _NOOP
+    return Span(name, attributes)
+
+
+def record(name: str, seconds: float) -> None:
+    """记录一段在别处测得的耗时（例如回调里成对出现的开始/结束事件）"""
+    if _enabled:
+        timings.record(name, seconds)
+
+
+def inject(carrier: Dict[str, Any]) -> Dict[str, Any]:
+    """把当前 trace context 以 W3C traceparent 写入 carrier（如 MCP 请求的 _meta），追踪关闭时原样返回"""
+    if not _enabled:
+        return carrier
+    if _otel_tracer is not None and _otel_recording():
+        otel_propagate.inject(carrier)
+        return carrier
+    # 未配置 OTel SDK 时当前 OTel span 不记录、propagator 什么也不写，改用内置的 traceparent
+    current = _current.get()
+    if current is not None:
+        carrier["traceparent"] = current.traceparent
+    return carrier
+
+
+@contextlib.contextmanager
+def remote_parent(carrier: Optional[Dict[str, Any]]) -> Iterator[None]:
+    """在服务端把请求携带的 traceparent 设为后续 span 的父节点"""
+    if not _enabled or not carrier or not carrier.get("traceparent"):
+        yield
+        return
+    match = _TRACEPARENT.match(carrier["traceparent"])
+    token = _current.set(SpanContext(match.group(1), match.group(2))) if match else None
+    otel_token = otel_context.attach(otel_propagate.extract(carrier)) if _otel_tracer is not None else None
+    try:
+        yield
+    finally:
+        if otel_token is not None:
+            otel_context.detach(otel_token)
+        if token is not None:
+            _current.reset(token)
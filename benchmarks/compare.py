@@ -0,0 +1,59 @@
+# 比较两次基准测试的 JSON 结果，延迟增长超过阈值时以非零状态码退出，便于在 CI 中拦截回归。
+#
+# 用法：
+#     python -m benchmarks.compare base.json head.json --threshold 0.10
+import argparse
+import json
+import sys
+from typing import Any, Dict, List, Optional
+
+METRICS = ["p50_ms", "p95_ms", "p99_ms"]
+
+
+def compare(base: Dict[str, Any], head: Dict[str, Any], threshold: float) -> List[Dict[str, Any]]:
+    """逐场景比较分位数延迟，返回每项的相对变化；regression 表示增长超过 threshold"""
+    rows = []
+    for scenario, head_stats in head["results"].items():
+        base_stats = base["results"].get(scenario)
+        if base_stats is None:
+            continue
+        for metric in METRICS:
+            before, after = base_stats[metric], head_stats[metric]
+            change = (after - before) / before if before else 0.0
+            rows.append({
+                "scenario": scenario,
+                "metric": metric,
+                "base": before,
+                "head": after,
+                "change": round(change, 4),
+                "regression": change > threshold,
+            })
+    return rows
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Compare two benchmark result files")
+    parser.add_argument("base", help="Baseline JSON produced by benchmarks.run")
+    parser.add_argument("head", help="Candidate JSON produced by benchmarks.run")
+    parser.add_argument("--threshold", type=float, default=0.10, help="Allowed relative latency increase")
+    parser.add_argument("--json", action="store_true", help="Print the comparison as JSON")
+    args = parser.parse_args(argv)
+
+    with open(args.base) as f:
+        base = json.load(f)
+    with open(args.head) as f:
+        head = json.load(f)
+    rows = compare(base, head, args.threshold)
+
+    if args.json:
+        print(json.dumps(rows, indent=2))
+    else:
+        for row in rows:
+            flag = "  REGRESSION" if row["regression"] else ""
+            print(f"{row['scenario']:16} {row['metric']:7} {row['base']:10.2f} -> {row['head']:10.2f} ms "
+                  f"({row['change']:+.1%}){flag}")
+    return 1 if any(row["regression"] for row in rows) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,60 @@
+# 脚本化的聊天模型替身，用于在不访问 OpenAI 的情况下跑完整的 Agent 循环。
+import asyncio
+import json
+from typing import Any, Dict, List, Optional
+
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage, ToolMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+# 工具名 -> 调用参数
+DEFAULT_SCRIPT: Dict[str, Dict[str, Any]] = {
+    "calculate": {"expression": "(5 + 3) * 2 / 7 - 9"},
+    "get_alerts": {"state": "CA"},
+    "get_forecast": {"latitude": 37.7749, "longitude": -122.4194},
+}
+
+
+class ScriptedChatModel(BaseChatModel):
+    """
+    按脚本发起工具调用的聊天模型。
+
+    第一轮对每个已绑定且在脚本中有参数的工具各发起一次并行工具调用，收到工具结果后给出最终答案。
+    模型无状态，可被多个 Agent 并发使用；latency 为每次调用的模拟推理延迟（秒）。
+    """
+
+    model_name: str = "scripted"
+    temperature: float = 0.0
+    latency: float = 0.0
+    script: Dict[str, Dict[str, Any]] = DEFAULT_SCRIPT
+
+    @property
+    def _llm_type(self) -> str:
+        return "scripted"
+
+    def _respond(self, messages: List[BaseMessage], tools: Optional[List[Dict[str, Any]]]) -> AIMessage:
+        if isinstance(messages[-1], ToolMessage):
+            observations = [message.content for message in messages if isinstance(message, ToolMessage)]
+            return AIMessage(content=f"Final answer based on {len(observations)} tool results.")
+        names = [tool["function"]["name"] for tool in tools or []]
+        calls = [
+            {
+                "id": f"call_{i}",
+                "type": "function",
+                "function": {"name": name, "arguments": json.dumps(self.script[name])},
+            }
+            for i, name in enumerate(name for name in names if name in self.script)
+        ]
+        if not calls:
+            return AIMessage(content="No scripted tools are available.")
+        return AIMessage(content="", additional_kwargs={"tool_calls": calls})
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        message = self._respond(messages, kwargs.get("tools"))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        message = self._respond(messages, kwargs.get("tools"))
+        return ChatResult(generations=[ChatGeneration(message=message)])
@@ -0,0 +1,60 @@
+# 本地 NWS API 替身：返回与 api.weather.gov 结构一致的固定数据，可配置响应延迟。
+# 响应不带缓存头，WeatherServer 在 response_ttl=0 时每次调用都会真正访问上游。
+import asyncio
+
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+
+
+def create_app(latency: float = 0.0, alerts: int = 8, periods: int = 14) -> Starlette:
+    """
+    Args:
+        latency: 每个请求的模拟上游延迟（秒）
+        alerts: 每个州返回的警报条数
+        periods: 每个预报返回的时段数
+    """
+
+    async def points(request: Request) -> JSONResponse:
+        await asyncio.sleep(latency)
+        latitude, _, longitude = request.path_params["coords"].partition(",")
+        grid = f"{abs(hash(latitude)) % 100},{abs(hash(longitude)) % 100}"
+        return JSONResponse({
+            "properties": {"forecast": f"{str(request.base_url).rstrip('/')}/gridpoints/TOP/{grid}/forecast"}
+        })
+
+    async def forecast(request: Request) -> JSONResponse:
+        await asyncio.sleep(latency)
+        return JSONResponse({"properties": {"periods": [
+            {
+                "name": f"Period {i}",
+                "temperature": 60 + i,
+                "temperatureUnit": "F",
+                "windSpeed": "5 to 10 mph",
+                "windDirection": "W",
+                "shortForecast": "Sunny",
+                "detailedForecast": "Sunny, with a high near 68. West wind 5 to 10 mph. " * 3,
+            }
+            for i in range(periods)
+        ]}})
+
+    async def area_alerts(request: Request) -> JSONResponse:
+        await asyncio.sleep(latency)
+        state = request.path_params["state"]
+        return JSONResponse({"features": [
+            {"properties": {
+                "event": "Heat Advisory",
+                "areaDesc": f"{state} Zone {i}",
+                "severity": "Moderate",
+                "description": "Hot temperatures and high humidity expected. " * 10,
+                "instruction": "Drink plenty of fluids and stay out of the sun. " * 3,
+            }}
+            for i in range(alerts)
+        ]})
+
+    return Starlette(routes=[
+        Route("/points/{coords}", endpoint=points),
+        Route("/gridpoints/{office}/{grid}/forecast", endpoint=forecast),
+        Route("/alerts/active/area/{state}", endpoint=area_alerts),
+    ])
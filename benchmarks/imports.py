@@ -0,0 +1,76 @@
+# 导入耗时基准：每次在全新的解释器中导入目标模块，只计导入本身（不含解释器启动）。
+# 输出格式与 benchmarks.run 相同，可直接用 benchmarks.compare 比较。
+#
+# 用法：
+#     python -m benchmarks.imports --runs 20 --output imports.json
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from .stats import git_commit, summarize
+
+ROOT = Path(__file__).resolve().parent.parent
+
+MODULES = [
+    "autoagentsai",
+    "autoagentsai.client",
+    "autoagentsai.prebuilt.create_react_agent",
+    "autoagentsai.Server.weather_server",
+]
+
+_PROBE = "import time; started = time.perf_counter(); import {module}; print(time.perf_counter() - started)"
+
+
+def import_time(module: str) -> float:
+    """在子进程中导入 module，返回导入耗时（秒）"""
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [str(ROOT), os.environ.get("PYTHONPATH")])))
+    output = subprocess.run(
+        [sys.executable, "-W", "ignore", "-c", _PROBE.format(module=module)],
+        capture_output=True, text=True, check=True, cwd=ROOT, env=env,
+    ).stdout
+    return float(output.strip().splitlines()[-1])
+
+
+def main(argv: Optional[List[str]] = None) -> Dict[str, Any]:
+    parser = argparse.ArgumentParser(description="Measure import time of autoagentsai modules")
+    parser.add_argument("--runs", type=int, default=20, help="Fresh interpreters per module")
+    parser.add_argument("--module", action="append", help="Measure only these modules")
+    parser.add_argument("--output", help="Write JSON results to this file instead of stdout")
+    args = parser.parse_args(argv)
+
+    started = time.time()
+    results: Dict[str, Any] = {}
+    for module in args.module or MODULES:
+        samples = [import_time(module) for _ in range(args.runs)]
+        results[f"import {module}"] = summarize(samples, sum(samples))
+
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": started,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "args": {key: value for key, value in vars(args).items() if key != "output"},
+        },
+        "results": results,
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        Path(args.output).write_text(text + "\n")
+    else:
+        print(text)
+
+    for name, stats in results.items():
+        print(f"{name:50} p50 {stats['p50_ms']:9.2f} ms  p95 {stats['p95_ms']:9.2f} ms", file=sys.stderr)
+    return report
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,194 @@
+# 离线基准测试：本地 NWS 替身 + 脚本化 LLM + 真实的 math_server.py / WeatherServer。
+#
+# 用法：
+#     python -m benchmarks.run --iterations 200 --concurrency 16 --output bench.json
+#     python -m benchmarks.compare base.json bench.json
+import argparse
+import asyncio
+import json
+import os
+import platform
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+import uvicorn
+
+import autoagentsai
+from autoagentsai.client import MCPClient
+from autoagentsai.prebuilt import AgentFactory
+from autoagentsai.Server.weather_server import WeatherServer, create_starlette_app
+
+from . import fake_nws
+from .fake_llm import ScriptedChatModel
+from .stats import git_commit, summarize
+
+MATH_SERVER = Path(autoagentsai.__file__).parent / "Server" / "math_server.py"
+
+SCENARIOS = [
+    "discovery_cold",
+    "discovery_warm",
+    "math_invoke",
+    "weather_invoke",
+    "fanout",
+    "react_loop",
+]
+
+
+class ServerThread:
+    """在独立线程和事件循环中运行 uvicorn，避免服务端与被测客户端争用同一个事件循环"""
+
+    def __init__(self, app, host: str = "127.0.0.1"):
+        self.host = host
+        self.server = uvicorn.Server(uvicorn.Config(app, host=host, port=0, log_level="warning"))
+        self.thread = threading.Thread(target=self.server.run, daemon=True)
+
+    def __enter__(self) -> str:
+        self.thread.start()
+        while not self.server.started:
+            if not self.thread.is_alive():
+                raise RuntimeError("benchmark server failed to start")
+            time.sleep(0.01)
+        port = self.server.servers[0].sockets[0].getsockname()[1]
+        return f"http://{self.host}:{port}"
+
+    def __exit__(self, *exc_info) -> None:
+        self.server.should_exit = True
+        self.thread.join(timeout=10)
+
+
+async def measure(fn: Callable[[], Awaitable[Any]], iterations: int, concurrency: int = 1,
+                  operations_per_call: int = 1) -> Dict[str, Any]:
+    """以 concurrency 个并发工作协程执行 fn 共 iterations 次，统计每次耗时"""
+    samples: List[float] = []
+    remaining = iter(range(iterations))
+
+    async def worker():
+        for _ in remaining:
+            started = time.perf_counter()
+            await fn()
+            samples.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return summarize(samples, time.perf_counter() - started, len(samples) * operations_per_call)
+
+
+def client_config(weather_url: str, math_args: List[str]) -> Dict[str, Any]:
+    return {
+        "math": {
+            "command": sys.executable,
+            "args": [str(MATH_SERVER), *math_args],
+            "transport": "stdio",
+        },
+        "weather": {
+            "url": weather_url,
+            "transport": "streamable_http",
+        },
+    }
+
+
+async def run_scenarios(args: argparse.Namespace, weather_url: str) -> Dict[str, Any]:
+    config = client_config(weather_url, ["--concurrent"] if args.concurrent_math else [])
+    results: Dict[str, Any] = {}
+    selected = args.scenario or SCENARIOS
+
+    if "discovery_cold" in selected:
+        # 冷启动：每次新建客户端，包含启动 math 子进程和建立 SSE 会话
+        async def discover_cold():
+            async with MCPClient(config) as client:
+                await client.get_tools()
+        results["discovery_cold"] = await measure(discover_cold, max(args.iterations // 10, 5))
+
+    async with MCPClient(config) as client:
+        tools = await client.get_tools()
+        expressions = iter(range(10 ** 9))
+
+        if "discovery_warm" in selected:
+            results["discovery_warm"] = await measure(client.get_tools, args.iterations)
+
+        if "math_invoke" in selected:
+            # 每次使用不同表达式，避免命中服务端的解析缓存
+            async def math_invoke():
+                await client.invoke("math", "calculate", {"expression": f"({next(expressions)} + 3) * 2 / 7"})
+            results["math_invoke"] = await measure(math_invoke, args.iterations)
+
+        if "weather_invoke" in selected:
+            async def weather_invoke():
+                await client.invoke("weather", "get_alerts", {"state": "CA"})
+            results["weather_invoke"] = await measure(weather_invoke, args.iterations)
+
+        if "fanout" in selected:
+            # 一次扇出 concurrency 个调用（math 与 weather 交替），样本为整轮耗时
+            async def fanout():
+                await asyncio.gather(*(
+                    client.invoke("math", "calculate", {"expression": f"{next(expressions)} * 2"})
+                    if i % 2 == 0 else
+                    client.invoke("weather", "get_forecast", {"latitude": 37.7749, "longitude": -122.4194})
+                    for i in range(args.concurrency)
+                ))
+            rounds = max(args.iterations // args.concurrency, 10)
+            results["fanout"] = await measure(fanout, rounds, operations_per_call=args.concurrency)
+
+        if "react_loop" in selected:
+            # 完整的 Agent 循环：脚本化模型一轮并行调用全部工具，再给出最终答案
+            factory = AgentFactory(
+                verbose=False,
+                llm_factory=lambda **settings: ScriptedChatModel(latency=args.llm_latency, **settings),
+            )
+
+            async def react_loop():
+                agent = factory.create("scripted", tools)
+                await agent.ainvoke({"input": "What's the weather in San Francisco, and what is (5 + 3) * 2?"})
+            results["react_loop"] = await measure(react_loop, max(args.iterations // 4, 10), args.agents)
+
+    return results
+
+
+def main(argv: Optional[List[str]] = None) -> Dict[str, Any]:
+    parser = argparse.ArgumentParser(description="Offline MCP client / server benchmarks")
+    parser.add_argument("--iterations", type=int, default=200, help="Samples per scenario")
+    parser.add_argument("--concurrency", type=int, default=16, help="Calls per fan-out round")
+    parser.add_argument("--agents", type=int, default=4, help="Concurrent agents in the react_loop scenario")
+    parser.add_argument("--nws-latency", type=float, default=0.02, help="Simulated upstream latency in seconds")
+    parser.add_argument("--llm-latency", type=float, default=0.0, help="Simulated model latency in seconds")
+    parser.add_argument("--concurrent-math", action="store_true", help="Run math_server.py with --concurrent")
+    parser.add_argument("--scenario", action="append", choices=SCENARIOS, help="Run only these scenarios")
+    parser.add_argument("--output", help="Write JSON results to this file instead of stdout")
+    args = parser.parse_args(argv)
+
+    # response_ttl=0 且上游不带缓存头：每次天气调用都会访问（本地）上游
+    weather_server = WeatherServer(response_ttl=0, http2=False)
+    with ServerThread(fake_nws.create_app(latency=args.nws_latency)) as nws_url:
+        weather_server.NWS_API_BASE = nws_url
+        with ServerThread(create_starlette_app(weather_server)) as weather_url:
+            started = time.time()
+            results = asyncio.run(run_scenarios(args, weather_url))
+
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": started,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "args": {key: value for key, value in vars(args).items() if key != "output"},
+        },
+        "results": results,
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        Path(args.output).write_text(text + "\n")
+    else:
+        print(text)
+
+    for name, stats in results.items():
+        print(f"{name:16} p50 {stats['p50_ms']:9.2f} ms  p95 {stats['p95_ms']:9.2f} ms  "
+              f"p99 {stats['p99_ms']:9.2f} ms  {stats['throughput_per_s']:9.1f} ops/s", file=sys.stderr)
+    return report
+
+
+if __name__ == "__main__":
+    main()
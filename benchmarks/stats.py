@@ -0,0 +1,47 @@
+# 基准结果的统计与元信息工具；只依赖标准库，导入耗时基准（benchmarks.imports）可以直接使用，
+# 不会把 uvicorn、mcp 等依赖带进测量进程。
+import subprocess
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+
+def percentile(sorted_samples: List[float], q: float) -> float:
+    """最近秩法计算分位数"""
+    if not sorted_samples:
+        return 0.0
+    rank = max(int(round(q / 100 * len(sorted_samples) + 0.5)) - 1, 0)
+    return sorted_samples[min(rank, len(sorted_samples) - 1)]
+
+
+def summarize(samples: List[float], wall: float, operations: Optional[int] = None) -> Dict[str, Any]:
+    """
+    汇总一个场景的耗时样本（秒）。
+
+    Args:
+        samples: 每次测量的耗时
+        wall: 场景总耗时，用于计算吞吐量
+        operations: 完成的操作数，默认等于样本数（扇出场景中一个样本包含多次调用）
+    """
+    ordered = sorted(samples)
+    operations = len(samples) if operations is None else operations
+    to_ms = lambda seconds: round(seconds * 1000, 3)
+    return {
+        "count": len(samples),
+        "operations": operations,
+        "mean_ms": to_ms(sum(ordered) / len(ordered)) if ordered else 0.0,
+        "p50_ms": to_ms(percentile(ordered, 50)),
+        "p95_ms": to_ms(percentile(ordered, 95)),
+        "p99_ms": to_ms(percentile(ordered, 99)),
+        "max_ms": to_ms(ordered[-1]) if ordered else 0.0,
+        "throughput_per_s": round(operations / wall, 2) if wall > 0 else 0.0,
+    }
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=Path(__file__).resolve().parent,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
@@ -1,4 +1,7 @@
 import asyncio
+
+from dotenv import load_dotenv
+
 from autoagentsai.prebuilt import create_react_agent
 from autoagentsai.client import MCPClient
 # from langchain.agents import AgentExecutor, create_react_agent
@@ -12,6 +15,8 @@ async def main():
                 "args": ["/Users/jeffzzc/code/autoagents/autoagentsai/Server/math_server.py"],
                 "transport": "stdio",
                 "description": "Perform mathematical calculations",
+                # calculate 是纯函数，相同表达式的结果可以一直复用
+                "cache": {"calculate": {"pure": True}},
             },
             "weather": {
                 # Ensure you start your weather server on port 8888
@@ -22,7 +27,7 @@ async def main():
         }
     )
 
-    tools = mcp_client.get_tools()
+    tools = await mcp_client.get_tools()
 
     print("Available tools:", [tool.name for tool in tools])
 
@@ -35,8 +40,11 @@ async def main():
     print("Answer:", res["output"])
 
     print(tools)
-    
+
+    await mcp_client.close()
+
 
 if __name__ == "__main__":
+    load_dotenv()  # 从 .env 读取 OPENAI_API_KEY 等环境变量
     asyncio.run(main())
 
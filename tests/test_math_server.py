@@ -0,0 +1,48 @@
+import math
+
+import pytest
+
+from autoagentsai.Server import math_server
+from autoagentsai.Server.math_server import calculate, calculate_batch
+
+
+def _chain(terms):
+    return "+".join(["1"] * terms)
+
+
+def test_long_chain_within_length_limit():
+    expression = _chain(1000)
+    assert len(expression) < math_server.MAX_EXPRESSION_LENGTH
+    assert calculate(expression) == {"result": 1000.0}
+    assert calculate_batch([expression] * 10) == [{"result": 1000.0}] * 10
+
+
+def test_chain_at_length_limit_fails_cleanly():
+    expression = _chain(math_server.MAX_EXPRESSION_LENGTH // 2)
+    assert len(expression) == math_server.MAX_EXPRESSION_LENGTH - 1
+    response = calculate(expression)
+    # 要么算出结果，要么给出明确的错误，不能抛出 RecursionError
+    assert response in ({"result": float(math_server.MAX_EXPRESSION_LENGTH // 2)},
+                        {"error": "计算错误: 表达式嵌套过深"})
+    assert calculate("-" * 5000 + "1") == {"error": "计算错误: 表达式嵌套过深"}
+
+
+@pytest.mark.parametrize("terms", [math_server.CLOSURE_MAX_DEPTH - 1, math_server.CLOSURE_MAX_DEPTH,
+                                   math_server.CLOSURE_MAX_DEPTH + 1])
+def test_closure_and_loop_evaluation_agree(terms):
+    # 嵌套深度跨过闭包与循环求值的分界时结果与错误保持一致
+    assert calculate(_chain(terms)) == {"result": float(terms)}
+    assert calculate("2 * " * terms + "2 ** 5000") == {"error": "计算错误: 指数过大"}
+    assert calculate("1 + " * terms + "1 / 0") == {"error": "计算错误: division by zero"}
+
+
+@pytest.mark.parametrize("expression", [
+    "0 * -5", "-0", "-1 * 0", "+-0", "0 * -5 / 2", "(0 * -5) * 1.0", "-0 * 1.0",
+    "0 / -3", "-0.0", "-(0 * 1.0)", "3 * 4 - 12", "2 + 3", "-2 * 3", "7 - 7.5",
+])
+def test_batch_matches_scalar_including_zero_sign(expression):
+    expected = calculate(expression)
+    # 同一结构重复多次以走向量化路径（安装了 numpy 时）
+    for response in calculate_batch([expression] * math_server.VECTORIZE_MIN_BATCH):
+        assert response == expected
+        assert math.copysign(1.0, response["result"]) == math.copysign(1.0, expected["result"])
@@ -0,0 +1,107 @@
+import asyncio
+import os
+import sys
+import textwrap
+
+import pytest
+
+from autoagentsai.client.errors import MCPTimeoutError, MCPTransportError
+from autoagentsai.client.stdio_transport import StdioServerProcess
+
+# 回传 id 的最小 stdio 服务：expression 为 "close" 时关闭 stdout 但进程不退出，"sleep" 时长时间不应答
+TAGGED_SERVER = textwrap.dedent("""
+    import json, os, sys, time
+    for line in sys.stdin:
+        action, _, body = line.strip().partition(" ")
+        payload = json.loads(body) if body else {}
+        expression = payload.get("parameters", {}).get("expression")
+        if expression == "close":
+            sys.stdout.close()
+            os.close(1)
+            time.sleep(60)
+        if expression == "sleep":
+            time.sleep(60)
+        reply = {"id": payload.get("id"), "result": expression} if action == "INVOKE" else {"id": payload.get("id"), "tools": []}
+        print(json.dumps(reply), flush=True)
+""")
+
+# 不回传 id 的旧版服务：严格按顺序一问一答，expression 为 "slow" 时延迟应答
+UNTAGGED_SERVER = textwrap.dedent("""
+    import json, sys, time
+    for line in sys.stdin:
+        action, _, body = line.strip().partition(" ")
+        expression = (json.loads(body) if body else {}).get("parameters", {}).get("expression")
+        if expression == "slow":
+            time.sleep(0.5)
+        print(json.dumps({"result": expression} if action == "INVOKE" else {"tools": []}), flush=True)
+""")
+
+
+def _worker(tmp_path, source):
+    script = tmp_path / "server.py"
+    script.write_text(source)
+    return StdioServerProcess(sys.executable, [str(script)], wire_format="json")
+
+
+def _invoke(worker, expression, timeout=5.0):
+    return asyncio.wait_for(worker.request("INVOKE", {"parameters": {"expression": expression}}), timeout)
+
+
+def test_worker_with_closed_stdout_is_restarted(tmp_path):
+    async def scenario():
+        worker = _worker(tmp_path, TAGGED_SERVER)
+        try:
+            assert (await _invoke(worker, "1"))["result"] == "1"
+            first = worker.process
+            with pytest.raises(MCPTransportError):
+                await _invoke(worker, "close")
+            # stdout 已关闭但子进程仍在运行：不能再被视为存活，下一次请求应重启而不是挂起
+            assert first.returncode is None
+            assert not worker.alive
+            assert (await _invoke(worker, "2"))["result"] == "2"
+            assert worker.process is not first
+            assert await asyncio.wait_for(first.wait(), 5) is not None
+        finally:
+            await worker.close()
+
+    asyncio.run(scenario())
+
+
+def test_worker_killed_mid_request(tmp_path):
+    async def scenario():
+        worker = _worker(tmp_path, TAGGED_SERVER)
+        try:
+            await worker.start()
+            call = asyncio.ensure_future(_invoke(worker, "sleep"))
+            await asyncio.sleep(0.2)
+            os.kill(worker.process.pid, 9)
+            with pytest.raises(MCPTransportError):
+                await call
+            assert (await _invoke(worker, "3"))["result"] == "3"
+        finally:
+            await worker.close()
+
+    asyncio.run(scenario())
+
+
+def test_untagged_late_reply_is_not_delivered_to_next_request(tmp_path):
+    async def scenario():
+        worker = _worker(tmp_path, UNTAGGED_SERVER)
+        try:
+            await worker.start()
+            assert not worker.tagged
+            with pytest.raises(MCPTimeoutError):
+                await worker.request("INVOKE", {"parameters": {"expression": "slow"}}, timeout=0.1)
+            # 超时请求的迟到响应必须被丢弃，而不是按先进先出交给下一个请求
+            assert (await _invoke(worker, "next"))["result"] == "next"
+
+            cancelled = asyncio.ensure_future(_invoke(worker, "slow"))
+            await asyncio.sleep(0.1)
+            cancelled.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await cancelled
+            assert (await _invoke(worker, "after"))["result"] == "after"
+        finally:
+            await worker.close()
+
+    asyncio.run(scenario())